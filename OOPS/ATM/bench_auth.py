@@ -0,0 +1,77 @@
+# ATM sessions per second with and without the verification cache, run
+# through ATM.add_card / add_money / remove_money. ATM ends its session after
+# each transaction, so a session is one card insertion plus one operation:
+# the cache saves the second PIN hash, not the first.
+#
+# Also checks that a cached session still rejects a wrong PIN, and that a
+# cold PIN hash on one thread does not hold up cached operations on the same
+# account from another.
+#
+#     python bench_auth.py [sessions]
+import contextlib
+import io
+import sys
+import threading
+import time
+
+from main import ATM, Account, CreditCard, PinAuthStratergy, VerificationCache
+
+def sessions_per_second(cache, sessions):
+    account = Account(10 ** 9)
+    card = CreditCard("1", "0000", PinAuthStratergy(cache), account)
+    account.add_card(card)
+    atm = ATM()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(sessions):
+            atm.add_card(card, "0000")
+            if i % 2:
+                atm.add_money(100)
+            else:
+                atm.remove_money(100)
+    return sessions / (time.perf_counter() - start)
+
+def check_wrong_pin_in_cached_session():
+    account = Account(100)
+    card = CreditCard("1", "1234", PinAuthStratergy(VerificationCache()), account)
+    account.add_card(card)
+    assert card.auth_pin("1234", "session")
+    assert not account.remove_money(50, card, "0000", "session")
+    assert account.remove_money(50, card, "1234", "session") and account.amount == 50
+
+def cached_latency_under_cold_hashes(operations=200):
+    account = Account(10 ** 9)
+    cached_card = CreditCard("1", "0000", PinAuthStratergy(VerificationCache()), account)
+    cold_card = CreditCard("2", "0000", PinAuthStratergy(), account)
+    account.add_card(cached_card)
+    account.add_card(cold_card)
+    cached_card.auth_pin("0000", "session")
+    done = threading.Event()
+
+    def cold():
+        while not done.is_set():
+            account.add_money(1, cold_card, "0000")
+
+    thread = threading.Thread(target=cold)
+    thread.start()
+    worst = 0.0
+    for _ in range(operations):
+        start = time.perf_counter()
+        account.add_money(1, cached_card, "0000", "session")
+        worst = max(worst, time.perf_counter() - start)
+        time.sleep(0.001)
+    done.set()
+    thread.join()
+    return worst
+
+def main():
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    check_wrong_pin_in_cached_session()
+    without = sessions_per_second(None, sessions)
+    with_cache = sessions_per_second(VerificationCache(), sessions)
+    print(f"without cache: {without:.1f} sessions/s")
+    print(f"with cache:    {with_cache:.1f} sessions/s")
+    print(f"worst cached deposit while another card hashes: {cached_latency_under_cold_hashes() * 1000:.2f}ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+# Throughput of Ledger deposits with the write-ahead journal on, for a few
+# batch sizes and commit delays, and with size-triggered compaction. Every
+# deposit returns only after its fsync. Each run is checked by reopening the
+# journal.
+#
+#     python bench_journal.py [threads] [operations per thread]
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from main import Journal, Ledger
+
+ACCOUNTS = 64
+
+def run(path, threads, operations, batch_size, max_delay, compact_records=None):
+    journal = Journal(path, batch_size=batch_size, max_delay=max_delay, compact_records=compact_records)
+    ledger = Ledger(journal=journal)
+    for i in range(ACCOUNTS):
+        ledger.open_account(str(i))
+
+    def worker(k):
+        for n in range(operations):
+            ledger.deposit(str((k * 7 + n) % ACCOUNTS), 1)
+
+    workers = [threading.Thread(target=worker, args=(k,)) for k in range(threads)]
+    start = time.perf_counter()
+    for worker_thread in workers:
+        worker_thread.start()
+    for worker_thread in workers:
+        worker_thread.join()
+    elapsed = time.perf_counter() - start
+    journal.close()
+    assert Journal(path).balances == ledger.balances
+    assert sum(ledger.balances.values()) == threads * operations
+    return threads * operations / elapsed
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    operations = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    runs = [(1, 0.0, None), (16, 0.0, None), (64, 0.0, None), (16, 0.001, None), (256, 0.001, None), (64, 0.0, 1000)]
+    for batch_size, max_delay, compact_records in runs:
+        with tempfile.TemporaryDirectory() as directory:
+            rate = run(os.path.join(directory, "journal"), threads, operations, batch_size, max_delay, compact_records)
+        compaction = f", compact every {compact_records} records" if compact_records else ""
+        print(f"batch_size {batch_size:>3} max_delay {max_delay * 1000:.0f}ms{compaction}: {rate:,.0f} durable ops/s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# Multi-threaded throughput of the per-call Account.add_money/remove_money
+# path against Ledger.deposit/withdraw and Ledger.post batches over the same
+# random stream of operations. Cards are authenticated once up front through
+# a cached session so PIN hashing is not measured. First checks that post
+# gives the same results as applying the operations one by one.
+#
+#     python bench_ledger.py [threads] [operations per thread] [accounts]
+import random
+import sys
+import threading
+import time
+
+from main import Account, CreditCard, Ledger, PinAuthStratergy, VerificationCache
+
+BATCH = 256
+
+def make_streams(threads, operations, accounts):
+    rng = random.Random(0)
+    return [
+        [(rng.choice(("deposit", "withdraw")), str(rng.randrange(accounts)), rng.randint(1, 10)) for _ in range(operations)]
+        for _ in range(threads)
+    ]
+
+def run_threads(target, streams):
+    workers = [threading.Thread(target=target, args=(stream,)) for stream in streams]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return sum(map(len, streams)) / (time.perf_counter() - start)
+
+def bench_accounts(streams, accounts):
+    strategy = PinAuthStratergy(VerificationCache(max_size=accounts, ttl=float("inf")))
+    pool = {}
+    for i in range(accounts):
+        account = Account(10 ** 9, str(i))
+        card = CreditCard(str(i), "0000", strategy, account)
+        account.add_card(card)
+        card.auth_pin("0000", "bench")
+        pool[str(i)] = (account, card)
+
+    def worker(stream):
+        for kind, account_id, amount in stream:
+            account, card = pool[account_id]
+            if kind == "deposit":
+                account.add_money(amount, card, "0000", "bench")
+            else:
+                account.remove_money(amount, card, "0000", "bench")
+
+    return run_threads(worker, streams)
+
+def new_ledger(accounts):
+    ledger = Ledger()
+    for i in range(accounts):
+        ledger.open_account(str(i), 10 ** 9)
+    return ledger
+
+def bench_ledger_calls(streams, accounts):
+    ledger = new_ledger(accounts)
+
+    def worker(stream):
+        for kind, account_id, amount in stream:
+            if kind == "deposit":
+                ledger.deposit(account_id, amount)
+            else:
+                ledger.withdraw(account_id, amount)
+
+    return run_threads(worker, streams)
+
+def bench_ledger_post(streams, accounts):
+    ledger = new_ledger(accounts)
+
+    def worker(stream):
+        for i in range(0, len(stream), BATCH):
+            ledger.post(stream[i:i + BATCH])
+
+    return run_threads(worker, streams)
+
+def check_post_matches_sequential(stream, accounts):
+    posted, sequential = new_ledger(accounts), new_ledger(accounts)
+    results = []
+    for i in range(0, len(stream), BATCH):
+        results += posted.post(stream[i:i + BATCH])
+    assert results == [sequential.apply(operation) for operation in stream]
+    assert posted.balances == sequential.balances
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    operations = int(sys.argv[2]) if len(sys.argv) > 2 else 50_000
+    accounts = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+    streams = make_streams(threads, operations, accounts)
+    check_post_matches_sequential(streams[0], accounts)
+    print(f"Account.add_money/remove_money: {bench_accounts(streams, accounts):,.0f} ops/s")
+    print(f"Ledger.deposit/withdraw:        {bench_ledger_calls(streams, accounts):,.0f} ops/s")
+    print(f"Ledger.post ({BATCH} per batch):     {bench_ledger_post(streams, accounts):,.0f} ops/s")
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,25 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import hmac
+import os
+import random
+import time
 from abc import ABC, abstractmethod
-from threading import Lock
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import reduce
+from itertools import islice
+from math import gcd
+from threading import Condition, Lock
+from uuid import uuid4
+from typing import Dict, Iterable, List, Optional, Tuple
+
+PIN_HASH_ITERATIONS = 100_000
+
+def hash_pin(pin: str, salt: bytes) -> bytes:
+    return hashlib.pbkdf2_hmac("sha256", pin.encode(), salt, PIN_HASH_ITERATIONS)
 
 class Card(ABC):
     def __init__(self, card_number, account: Account):
@@ -10,43 +30,289 @@ class Card(ABC):
     def set_pin(self, pin):
         raise NotImplementedError
     
-    def auth_pin(self, pin):
+    def auth_pin(self, pin, session=None):
         raise NotImplementedError
 
-def AuthStratergy(ABC):
+class AuthStratergy(ABC):
     @abstractmethod
-    def auth(self, card: Card, pin: str):
+    def auth(self, card: Card, pin: str, session=None):
         pass
 
-def PinAuthStratergy(AuthStratergy):
-    def auth(self, card: Card, pin: str):
-        pass
+# Bounded LRU of recent successful verifications that expire after ttl
+# seconds. secret keys the PIN digests stored in cache keys; it never leaves
+# the process.
+class VerificationCache:
+    def __init__(self, max_size: int = 1024, ttl: float = 60.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.secret = os.urandom(32)
+        self.entries: OrderedDict = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key) -> bool:
+        with self.lock:
+            expires = self.entries.get(key)
+            if expires is None:
+                return False
+            if expires < time.monotonic():
+                del self.entries[key]
+                return False
+            self.entries.move_to_end(key)
+            return True
+
+    def put(self, key) -> None:
+        with self.lock:
+            self.entries[key] = time.monotonic() + self.ttl
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    # A fast keyed digest of pin, so a cached session still checks the PIN
+    # entered without running PBKDF2 again.
+    def pin_digest(self, pin: str) -> bytes:
+        return hmac.new(self.secret, pin.encode(), hashlib.sha256).digest()
+
+# Checks the entered PIN against the card's salted PBKDF2 hash. With a cache,
+# a session that already passed skips the hash on later calls with the same
+# PIN; the key holds the card's pin_version so changing the PIN drops old
+# sessions, and a keyed digest of the PIN so a wrong one misses the cache.
+class PinAuthStratergy(AuthStratergy):
+    def __init__(self, cache: Optional[VerificationCache] = None):
+        self.cache = cache
+
+    def auth(self, card: Card, pin: str, session=None):
+        key = None
+        if session is not None and self.cache:
+            key = (card.card_number, card.pin_version, session, self.cache.pin_digest(pin))
+            if self.cache.get(key):
+                return True
+        if not hmac.compare_digest(hash_pin(pin, card.pin_salt), card.pin_hash):
+            return False
+        if key is not None:
+            self.cache.put(key)
+        return True
 
 
     
 class CreditCard(Card):
     def __init__(self, card_number: str, pin: str, auth_stratergy: AuthStratergy, account: Account):
         self.card_number = card_number
-        self.__pin = pin
         self.account = account
         self.auth_stratergy = auth_stratergy
+        self.pin_version = 0
+        self.set_pin(pin)
     
     def set_pin(self, pin):
-        self.__pin = pin
+        self.pin_salt = os.urandom(16)
+        self.pin_hash = hash_pin(pin, self.pin_salt)
+        self.pin_version += 1
     
-    def auth_pin(self, pin):
-        return self.auth_stratergy.auth(card=self, pin=self.__pin)
+    def auth_pin(self, pin, session=None):
+        return self.auth_stratergy.auth(card=self, pin=pin, session=session)
 
 
 class NotificationStratergy(ABC):
     def send_notification(self, user: User):
         raise NotImplementedError
 
+def fsync_directory(path: str) -> None:
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+# Write-ahead journal of balance changes, one line per operation prefixed by
+# its sequence number. append() returns only once an fsync covering the
+# record has finished (group commit): while one caller is writing a batch,
+# records from other callers queue up and the next leader writes up to
+# batch_size of them with a single fsync. A leader may wait up to max_delay
+# (by default not at all) for a batch to fill before writing it.
+#
+# The journal keeps the balances its records add up to, so it can compact
+# itself without help from its callers: once compact_records records or
+# compact_bytes bytes have been written since the last snapshot, the next
+# append writes a new snapshot and empties the journal. Startup replays the
+# last snapshot plus the journal records with a later sequence number.
+class Journal:
+    def __init__(
+        self,
+        path: str,
+        batch_size: int = 64,
+        max_delay: float = 0.0,
+        compact_records: Optional[int] = None,
+        compact_bytes: Optional[int] = None,
+    ):
+        self.path = path
+        self.snapshot_path = path + ".snapshot"
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.compact_records = compact_records
+        self.compact_bytes = compact_bytes
+        # (sequence, line) for records not yet written.
+        self.pending: List[Tuple[int, str]] = []
+        self.lock = Condition()
+        self.flushing = False
+        # Set when a batch fails to reach disk; its waiters raise it.
+        self.error: Optional[OSError] = None
+        self.balances, self.sequence, self.records, self.size = self.load()
+        self.durable = self.sequence
+        self.file = open(path, "a", encoding="utf-8")
+        # Drop a torn last line so new records do not run into it.
+        self.file.truncate(self.size)
+
+    def append(self, *changes: Tuple[str, int]) -> None:
+        with self.lock:
+            self.sequence += 1
+            sequence = self.sequence
+            self.pending.append(
+                (sequence, f"{sequence} " + " ".join(f"{account_id} {delta}" for account_id, delta in changes) + "\n")
+            )
+            for account_id, delta in changes:
+                self.balances[account_id] = self.balances.get(account_id, 0) + delta
+            deadline = time.monotonic() + self.max_delay
+            while self.durable < sequence:
+                if self.error is not None:
+                    raise self.error
+                remaining = deadline - time.monotonic()
+                if self.flushing:
+                    self.lock.wait()
+                elif len(self.pending) >= self.batch_size or remaining <= 0:
+                    self.flush()
+                else:
+                    self.lock.wait(remaining)
+            if not self.flushing and self.compaction_due():
+                self.compact_locked()
+
+    def compaction_due(self) -> bool:
+        return (self.compact_records is not None and self.records >= self.compact_records) or (
+            self.compact_bytes is not None and self.size >= self.compact_bytes
+        )
+
+    def commit(self) -> None:
+        with self.lock:
+            self.drain()
+
+    # Caller must hold self.lock. Returns once every pending record is
+    # durable and no flush is in progress.
+    def drain(self) -> None:
+        while self.flushing or self.pending:
+            if self.flushing:
+                self.lock.wait()
+            else:
+                self.flush()
+
+    # Writes the oldest batch_size pending records with one fsync. Caller
+    # must hold self.lock with no flush in progress. The lock is released
+    # around the write and fsync so the next batch can fill up.
+    def flush(self) -> None:
+        if not self.pending:
+            return
+        batch, self.pending = self.pending[: self.batch_size], self.pending[self.batch_size :]
+        data = "".join(line for _, line in batch)
+        self.flushing = True
+        self.lock.release()
+        try:
+            self.file.write(data)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+        except OSError as e:
+            self.error = e
+            raise
+        finally:
+            self.lock.acquire()
+            self.flushing = False
+            self.lock.notify_all()
+        self.durable = batch[-1][0]
+        self.records += len(batch)
+        self.size += len(data)
+
+    # Returns the recovered balances, the last sequence number, and the
+    # number of records and size in bytes of the journal up to its last
+    # complete line.
+    def load(self) -> Tuple[Dict[str, int], int, int, int]:
+        balances: Dict[str, int] = {}
+        sequence = 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                sequence = int(f.readline())
+                for line in f:
+                    account_id, amount = line.split()
+                    balances[account_id] = int(amount)
+        records = 0
+        valid_size = 0
+        if os.path.exists(self.path):
+            with open(self.path, "rb") as f:
+                for line in f:
+                    # A torn last line means its batch never finished its fsync.
+                    if not line.endswith(b"\n"):
+                        break
+                    records += 1
+                    valid_size += len(line)
+                    fields = line.split()
+                    record = int(fields[0])
+                    # Records up to the snapshot's sequence are already in it;
+                    # they survive when compaction stops before the truncate.
+                    if record <= sequence:
+                        continue
+                    sequence = record
+                    for i in range(1, len(fields), 2):
+                        account_id = fields[i].decode()
+                        balances[account_id] = balances.get(account_id, 0) + int(fields[i + 1])
+        return balances, sequence, records, valid_size
+
+    # Reads the balances back from disk.
+    def replay(self) -> Dict[str, int]:
+        return self.load()[0]
+
+    # Replaces the snapshot with the journal's balances, stamped with the
+    # last sequence number, and starts an empty journal. Appends wait while
+    # this runs, so callers need not stop mutations.
+    def compact(self) -> None:
+        with self.lock:
+            self.compact_locked()
+
+    def compact_locked(self) -> None:
+        self.drain()
+        temp_path = self.snapshot_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(f"{self.sequence}\n")
+            f.write("".join(f"{account_id} {amount}\n" for account_id, amount in self.balances.items()))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.snapshot_path)
+        fsync_directory(self.snapshot_path)
+        self.file.truncate(0)
+        os.fsync(self.file.fileno())
+        self.records = 0
+        self.size = 0
+
+    def close(self) -> None:
+        with self.lock:
+            self.drain()
+            self.file.close()
+
 class Account:
-    def __init__(self, amount):
+    # With a journal, the opening amount is journaled like any other change,
+    # so restore() can rebuild the balance after a restart.
+    def __init__(self, amount, account_id: Optional[str] = None, journal: Optional[Journal] = None):
+        if journal is not None and account_id is None:
+            raise ValueError("a journaled account needs an account_id")
         self.amount = amount
         self.cards = {}
         self.lock = Lock()
+        self.account_id = account_id
+        self.journal = journal
+        if journal is not None:
+            journal.append((account_id, amount))
+
+    # Rebuilds a journaled account from the balances the journal recovered
+    # when it was opened.
+    @classmethod
+    def restore(cls, account_id: str, journal: Journal) -> Account:
+        account = cls(journal.balances[account_id], account_id)
+        account.journal = journal
+        return account
     
     def add_card(self, card: Card):
         if card.card_number in self.cards:
@@ -59,30 +325,129 @@ class Account:
             return True
         return False
     
-    def remove_money(self, amount, card, pin):
-        with self.lock:
-            if self.auth_card(card=card, pin=pin):
-                if self.amount - amount < 0:
-                    return False
-                self.amount -= amount
-                return True
+    # The PIN is checked before taking the balance lock so a slow hash does
+    # not hold up other operations on the account.
+    def remove_money(self, amount, card, pin, session=None):
+        if not self.auth_card(card=card, pin=pin, session=session):
             return False
-
-    def add_money(self, amount, card, pin):
         with self.lock:
-            if self.auth_card(card=card, pin=pin):
-                self.amount += amount
-                return True
+            if self.amount - amount < 0:
+                return False
+            if self.journal:
+                self.journal.append((self.account_id, -amount))
+            self.amount -= amount
+            return True
+
+    def add_money(self, amount, card, pin, session=None):
+        if not self.auth_card(card=card, pin=pin, session=session):
             return False
+        with self.lock:
+            if self.journal:
+                self.journal.append((self.account_id, amount))
+            self.amount += amount
+            return True
 
-    def auth_card(self, card: Card, pin: str):
+    def auth_card(self, card: Card, pin: str, session=None):
         if card.card_number in self.cards:
-            return card.auth_pin(pin)
+            return card.auth_pin(pin, session)
         return False
 
 
         
 
+# Balances for many accounts behind a fixed pool of striped locks rather than
+# one lock per account. Transfers take both stripes in index order so two
+# opposite transfers can never deadlock.
+class Ledger:
+    def __init__(self, stripes: int = 64, journal: Optional[Journal] = None):
+        self.balances: Dict[str, int] = dict(journal.balances) if journal else {}
+        self.locks = [Lock() for _ in range(stripes)]
+        self.journal = journal
+
+    def stripe(self, account_id: str) -> int:
+        return hash(account_id) % len(self.locks)
+
+    def stripes_for(self, *account_ids: str) -> List[int]:
+        return sorted({self.stripe(account_id) for account_id in account_ids})
+
+    def open_account(self, account_id: str, amount: int = 0) -> None:
+        with self.locks[self.stripe(account_id)]:
+            if account_id not in self.balances:
+                if self.journal:
+                    self.journal.append((account_id, amount))
+                self.balances[account_id] = amount
+
+    # Folds the journal into a fresh snapshot. The journal tracks its own
+    # balances, so no stripe needs to be held.
+    def checkpoint(self) -> None:
+        self.journal.compact()
+
+    def balance(self, account_id: str) -> int:
+        return self.balances[account_id]
+
+    def deposit(self, account_id: str, amount: int) -> bool:
+        with self.locks[self.stripe(account_id)]:
+            return self.apply(("deposit", account_id, amount))
+
+    def withdraw(self, account_id: str, amount: int) -> bool:
+        with self.locks[self.stripe(account_id)]:
+            return self.apply(("withdraw", account_id, amount))
+
+    def transfer(self, source: str, target: str, amount: int) -> bool:
+        locks = [self.locks[i] for i in self.stripes_for(source, target)]
+        for lock in locks:
+            lock.acquire()
+        try:
+            return self.apply(("transfer", source, target, amount))
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+    # Caller must hold the stripes of every account in operation.
+    def apply(self, operation: Tuple) -> bool:
+        kind, account_id, *rest = operation
+        if account_id not in self.balances:
+            return False
+        if kind == "deposit":
+            changes = [(account_id, rest[0])]
+        elif kind == "withdraw":
+            if self.balances[account_id] < rest[0]:
+                return False
+            changes = [(account_id, -rest[0])]
+        elif kind == "transfer":
+            target, amount = rest
+            if target not in self.balances or self.balances[account_id] < amount:
+                return False
+            changes = [(account_id, -amount), (target, amount)]
+        else:
+            raise ValueError(kind)
+        if self.journal:
+            self.journal.append(*changes)
+        for changed_id, delta in changes:
+            self.balances[changed_id] += delta
+        return True
+
+    # Posts ("deposit", id, amount), ("withdraw", id, amount) and
+    # ("transfer", source, target, amount) operations in input order, with
+    # the same results as applying them one by one. Each chunk of chunk_size
+    # operations takes the stripes it touches once, in index order, and
+    # holds them while its operations are applied.
+    def post(self, operations: Iterable[Tuple], chunk_size: int = 256) -> List[bool]:
+        results: List[bool] = []
+        operations = iter(operations)
+        while True:
+            chunk = list(islice(operations, chunk_size))
+            if not chunk:
+                return results
+            stripes = self.stripes_for(*(account_id for operation in chunk for account_id in operation[1:-1]))
+            for i in stripes:
+                self.locks[i].acquire()
+            try:
+                results.extend(self.apply(operation) for operation in chunk)
+            finally:
+                for i in reversed(stripes):
+                    self.locks[i].release()
+
 class SMSNotification(NotificationStratergy):
     def send_notification(self, user):
         print("SMS notification send to user ", user)
@@ -106,6 +471,7 @@ class Money(MoneyType):
         self.ten_count = 0
         self.five_count = 0
         self.arr_of_money = [self.thousand_count, self.hundrand_count, self.ten_count, self.five_count]
+        self.plans = {}
     
     def can_add_money(self, amount_to_add):
         add_array = [0] * len(self.AMOUNT_TYPE)
@@ -127,33 +493,59 @@ class Money(MoneyType):
     def add_money(self, add_array):
         for i, item in enumerate(add_array):
             self.arr_of_money[i] += item
-        
+        self.plans.clear()
         return True
         
 
     def remove_money(self, add_array):
         for i, item in enumerate(add_array):
             self.arr_of_money[i] -= item
-        
+        self.plans.clear()
         return True
-    
-    def remove_money(self, amount):
-        add_array = [0] * len(self.AMOUNT_TYPE)
-        for i, amount in enumerate(self.AMOUNT_TYPE):
-            ans = amount_to_add // amount
-            if ans == 0:
-                continue
-            if self.arr_of_money[i] < ans:
-                ans = self.arr_of_money[i]
-            add_array[i] = ans
-            amount_to_add -= (amount * ans)
-            if amount_to_add == 0:
-                break
-        
-        if amount_to_add > 0:
+
+    # Plan with the fewest notes for amount that the notes in arr_of_money
+    # can cover, as counts per AMOUNT_TYPE, or False if there is none. Plans
+    # are remembered until the note counts change.
+    def can_remove_money(self, amount):
+        if amount not in self.plans:
+            self.plans[amount] = self.plan_notes(amount)
+        return self.plans[amount]
+
+    def plan_notes(self, amount):
+        unit = reduce(gcd, self.AMOUNT_TYPE)
+        if amount < 0 or amount % unit:
             return False
-        
-        return add_array
+        target = amount // unit
+        no_plan = target + 1
+        fewest = [0] + [no_plan] * target
+        # Each note count is split into 1, 2, 4, ... bundles so every bundle
+        # is used at most once; taken[i][a] records whether bundle i is part
+        # of the best plan for a using the bundles seen so far.
+        bundles = []
+        taken = []
+        for i, note in enumerate(self.AMOUNT_TYPE):
+            count = self.arr_of_money[i]
+            size = 1
+            while count > 0:
+                size = min(size, count)
+                count -= size
+                bundles.append((i, size, size * note // unit))
+                size *= 2
+        for _, size, step in bundles:
+            used = bytearray(target + 1)
+            for a in range(target, step - 1, -1):
+                if fewest[a - step] + size < fewest[a]:
+                    fewest[a] = fewest[a - step] + size
+                    used[a] = 1
+            taken.append(used)
+        if fewest[target] >= no_plan:
+            return False
+        plan = [0] * len(self.AMOUNT_TYPE)
+        for (i, size, step), used in zip(reversed(bundles), reversed(taken)):
+            if used[target]:
+                plan[i] += size
+                target -= step
+        return plan
         
 
         
@@ -163,25 +555,32 @@ class ATM:
     def __init__(self):
         self.money = Money()
         self.card = None
+        self.pin = None
+        self.session = None
 
-    def add_card(self, card: Card):
+    def add_card(self, card: Card, pin: str):
         if self.card is not None:
             return
-        if card.auth_pin():
+        session = uuid4().hex
+        if card.auth_pin(pin, session):
             self.card = card
+            self.pin = pin
+            self.session = session
         else:
             return
 
 
     def remove_card(self):
         self.card = None
+        self.pin = None
+        self.session = None
     
     def add_money(self, amount):
         if self.card is None:
             return
         money_or_not = self.money.can_add_money(amount)
         if money_or_not:
-            if self.card.account.add_money(amount):
+            if self.card.account.add_money(amount, self.card, self.pin, self.session):
                 self.money.add_money(money_or_not)
                 print("Money added!!")
             else:
@@ -198,7 +597,7 @@ class ATM:
             return False
         money_or_not = self.money.can_remove_money(amount=amount)
         if money_or_not:
-            if self.card.account.remove_money(amount):
+            if self.card.account.remove_money(amount, self.card, self.pin, self.session):
                 self.money.remove_money(money_or_not)
                 print("money removed!")
             else:
@@ -206,3 +605,93 @@ class ATM:
         else:
             print("Not able to remove given amount")
         self.remove_card()
+
+# Drop-in replacement for an Account lock that adds up how long callers
+# waited to get it.
+class TimedLock:
+    def __init__(self):
+        self.lock = Lock()
+        self.wait_time = 0.0
+        self.acquisitions = 0
+
+    def __enter__(self):
+        start = time.perf_counter()
+        self.lock.acquire()
+        self.wait_time += time.perf_counter() - start
+        self.acquisitions += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self.lock.release()
+
+class FleetReport:
+    def __init__(self, latencies: List[float], failures: int, lock_wait: float, elapsed: float):
+        self.latencies = sorted(latencies)
+        self.failures = failures
+        self.lock_wait = lock_wait
+        self.elapsed = elapsed
+
+    def percentile(self, p: float) -> float:
+        if not self.latencies:
+            return 0.0
+        return self.latencies[min(len(self.latencies) - 1, int(p * len(self.latencies)))]
+
+    @property
+    def throughput(self) -> float:
+        return len(self.latencies) / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return (
+            f"{len(self.latencies)} ops ({self.failures} failed) in {self.elapsed:.2f}s, "
+            f"{self.throughput:.0f} ops/s, p50 {self.percentile(0.5) * 1000:.3f}ms, "
+            f"p99 {self.percentile(0.99) * 1000:.3f}ms, lock wait {self.lock_wait:.3f}s"
+        )
+
+# Drives many virtual ATMs against a shared pool of accounts. Each ATM is a
+# coroutine whose deposits and withdrawals run on a thread pool, so the
+# Account locks see real contention. Every card authenticates once for the
+# fleet session up front, which keeps the PIN hash out of the measurements.
+async def simulate_atm_fleet(
+    atms: int = 1000,
+    accounts: int = 50,
+    operations: int = 10,
+    deposit_ratio: float = 0.5,
+    amount: int = 10,
+    workers: int = 32,
+    seed: int = 0,
+) -> FleetReport:
+    rng = random.Random(seed)
+    session = uuid4().hex
+    strategy = PinAuthStratergy(VerificationCache(max_size=accounts, ttl=float("inf")))
+    pool = []
+    for i in range(accounts):
+        account = Account(amount * operations * atms, account_id=str(i))
+        account.lock = TimedLock()
+        card = CreditCard(str(i), "0000", strategy, account)
+        account.add_card(card)
+        card.auth_pin("0000", session)
+        pool.append((account, card))
+    latencies: List[float] = []
+    failures = 0
+    loop = asyncio.get_running_loop()
+
+    async def run_atm(plan):
+        nonlocal failures
+        for account, card, deposit in plan:
+            action = account.add_money if deposit else account.remove_money
+            start = time.perf_counter()
+            ok = await loop.run_in_executor(executor, action, amount, card, "0000", session)
+            latencies.append(time.perf_counter() - start)
+            failures += not ok
+
+    plans = [
+        [(*rng.choice(pool), rng.random() < deposit_ratio) for _ in range(operations)]
+        for _ in range(atms)
+    ]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        start = time.perf_counter()
+        await asyncio.gather(*(run_atm(plan) for plan in plans))
+        elapsed = time.perf_counter() - start
+    lock_wait = sum(account.lock.wait_time for account, _ in pool)
+    return FleetReport(latencies, failures, lock_wait, elapsed)
+
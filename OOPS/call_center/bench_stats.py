@@ -0,0 +1,39 @@
+# Overhead of CallCenterStats on simulate_call_center: the same instruction
+# stream replayed with stats off and on, best of a few runs each.
+#
+#     python bench_stats.py [calls]
+import sys
+import time
+
+from main import CallCenterStats, simulate_call_center
+
+def instructions(calls):
+    stream = [["hire", "Respondent", f"r{i}"] for i in range(20)]
+    stream += [["hire", "Manager", f"m{i}"] for i in range(5)]
+    for i in range(calls):
+        stream.append(["dispatch", str(i)])
+        if i % 10 == 0:
+            stream.append(["escalate", str(i - 5)])
+        if i > 10:
+            stream.append(["end", str(i - 10)])
+    return stream
+
+def best_of(runs, stream, make_stats):
+    best = float("inf")
+    for _ in range(runs):
+        stats = make_stats()
+        start = time.perf_counter()
+        simulate_call_center(stream, stats)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    stream = instructions(calls)
+    off = best_of(3, stream, lambda: None)
+    on = best_of(3, stream, CallCenterStats)
+    print(f"stats off: {off:.2f}s")
+    print(f"stats on:  {on:.2f}s ({(on / off - 1) * 100:+.0f}%)")
+
+if __name__ == "__main__":
+    main()
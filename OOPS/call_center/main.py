@@ -1,13 +1,85 @@
+import heapq
+import random
+import time
 from collections import deque
-from typing import List
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
 
 MAX_RANKS = 3
 
+# Binary max-heap that also tracks where each item sits, so any item's key
+# can be changed or the item removed in O(log n).
+class IndexedMaxHeap:
+    def __init__(self):
+        self.items = []
+        self.keys = {}
+        self.positions = {}
+
+    def __contains__(self, item):
+        return item in self.positions
+
+    def __len__(self):
+        return len(self.items)
+
+    def peek(self):
+        return self.items[0] if self.items else None
+
+    def push(self, item, key):
+        self.items.append(item)
+        self.keys[item] = key
+        self.positions[item] = len(self.items) - 1
+        self.sift_up(len(self.items) - 1)
+
+    def update(self, item, key):
+        old_key = self.keys[item]
+        self.keys[item] = key
+        if key > old_key:
+            self.sift_up(self.positions[item])
+        else:
+            self.sift_down(self.positions[item])
+
+    def remove(self, item):
+        i = self.positions.pop(item)
+        del self.keys[item]
+        last = self.items.pop()
+        if i < len(self.items):
+            self.items[i] = last
+            self.positions[last] = i
+            self.sift_up(i)
+            self.sift_down(self.positions[last])
+
+    def swap(self, i, j):
+        self.items[i], self.items[j] = self.items[j], self.items[i]
+        self.positions[self.items[i]] = i
+        self.positions[self.items[j]] = j
+
+    def sift_up(self, i):
+        while i > 0:
+            parent = (i - 1) // 2
+            if self.keys[self.items[i]] <= self.keys[self.items[parent]]:
+                break
+            self.swap(i, parent)
+            i = parent
+
+    def sift_down(self, i):
+        while True:
+            largest = i
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < len(self.items) and self.keys[self.items[child]] > self.keys[self.items[largest]]:
+                    largest = child
+            if largest == i:
+                return
+            self.swap(i, largest)
+            i = largest
+
 class CallInstance:
     def __init__(self, number):
         self.number = number
         self.talking_to = None
         self.rank = 0
+        # Clock reading when the call last joined a queue, if stats are on.
+        self.enqueued_at = None
+        # Set when a caller hangs up while waiting; the queue drops it lazily.
+        self.abandoned = False
 
     def start_call(self, target, output):
         if self.talking_to is None and target.talking_to is None:
@@ -41,6 +113,7 @@ class Employee:
     def __init__(self, name):
         self.talking_to = None
         self.name = name
+        self.hire_order = None
 
     def __str__(self):
         return f"{self.name}"
@@ -77,6 +150,7 @@ class Respondent(Employee):
 
     def work(self, call_center, output):
         self.performance_rating += 1
+        call_center.rating_changed(self)
 
 class Manager(Employee):
     def __str__(self):
@@ -87,14 +161,7 @@ class Manager(Employee):
         return 1
 
     def work(self, call_center, output):
-        top_worker = None
-        for respondent in call_center.employees[0]:
-            if respondent.talking_to is None:
-                if (
-                    top_worker is None
-                    or respondent.performance_rating > top_worker.performance_rating
-                ):
-                    top_worker = respondent
+        top_worker = call_center.idle_respondents.peek()
         if top_worker is not None:
             output.append(
                 f"Respondent {top_worker.name} is promoted to Manager"
@@ -113,64 +180,233 @@ class Director(Employee):
     def work(self, call_center, output):
         output.append(f"{self} holds a meeting")
 
-class CallCenter:
+WAIT_BUCKETS = 32
+
+# Time-weighted level of a count, e.g. employees on shift, so utilization is
+# busy employee-time over staffed employee-time.
+class TimeWeightedCount:
     def __init__(self):
+        self.level = 0
+        self.area = 0.0
+        self.since = 0.0
+
+    def change(self, delta, now):
+        self.area += self.level * (now - self.since)
+        self.since = now
+        self.level += delta
+
+    def total(self, now):
+        return self.area + self.level * (now - self.since)
+
+# Clock for CallCenterStats that reads simulated time, advanced by
+# simulate_call_center_events as events fire.
+class SimulatedClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+# Per-rank queue waits, escalations and utilization for a CallCenter. Waits
+# go into log2 histograms: bucket 0 is under one resolution unit and bucket
+# k covers [resolution * 2**(k-1), resolution * 2**k). The clock defaults to
+# wall time; simulate_call_center_events drives a SimulatedClock instead.
+class CallCenterStats:
+    def __init__(self, clock: Callable[[], float] = time.perf_counter, resolution: float = 1e-6):
+        self.clock = clock
+        self.resolution = resolution
+        self.enqueued = [0] * MAX_RANKS
+        self.dispatched = [0] * MAX_RANKS
+        self.escalated = [0] * MAX_RANKS
+        self.wait_total = [0.0] * MAX_RANKS
+        self.wait_max = [0.0] * MAX_RANKS
+        self.wait_histogram = [[0] * WAIT_BUCKETS for _ in range(MAX_RANKS)]
+        self.staffed = [TimeWeightedCount() for _ in range(MAX_RANKS)]
+        self.busy = [TimeWeightedCount() for _ in range(MAX_RANKS)]
+
+    def call_enqueued(self, call):
+        self.enqueued[call.rank] += 1
+        call.enqueued_at = self.clock()
+
+    def call_dispatched(self, call):
+        now = self.clock()
+        rank = call.rank
+        wait = now - call.enqueued_at
+        self.dispatched[rank] += 1
+        self.wait_total[rank] += wait
+        if wait > self.wait_max[rank]:
+            self.wait_max[rank] = wait
+        bucket = min(int(wait / self.resolution).bit_length(), WAIT_BUCKETS - 1)
+        self.wait_histogram[rank][bucket] += 1
+        self.busy[call.talking_to.rank].change(1, now)
+
+    def call_released(self, employee, escalated):
+        if escalated:
+            self.escalated[employee.rank] += 1
+        self.busy[employee.rank].change(-1, self.clock())
+
+    def staff_changed(self, rank, delta):
+        self.staffed[rank].change(delta, self.clock())
+
+    def snapshot(self):
+        now = self.clock()
+        ranks = []
+        for rank in range(MAX_RANKS):
+            dispatched = self.dispatched[rank]
+            staffed = self.staffed[rank].total(now)
+            ranks.append({
+                "enqueued": self.enqueued[rank],
+                "dispatched": dispatched,
+                "escalated": self.escalated[rank],
+                "escalation_rate": self.escalated[rank] / dispatched if dispatched else 0.0,
+                "mean_wait": self.wait_total[rank] / dispatched if dispatched else 0.0,
+                "max_wait": self.wait_max[rank],
+                "wait_histogram": list(self.wait_histogram[rank]),
+                "utilization": self.busy[rank].total(now) / staffed if staffed else 0.0,
+            })
+        return ranks
+
+class CallCenter:
+    # Pass a CallCenterStats to record instrumentation; with None (the
+    # default) each hook costs a single attribute check.
+    def __init__(self, stats: Optional[CallCenterStats] = None):
+        self.stats = stats
         self.employees = []
         self.employee_map = {}
         self.call_queue = []
+        # Per rank, a heap of (hire_order, employee) for idle employees, so
+        # dispatch takes the longest-serving idle employee without scanning.
+        # Entries of employees that went busy or left are skipped lazily.
+        self.idle = []
+        self.hire_count = 0
+        # Idle respondents by (rating, earliest hire) for Manager.work.
+        self.idle_respondents = IndexedMaxHeap()
         for _ in range(MAX_RANKS):
-            self.employees.append([])
+            # Dicts used as ordered sets so removal is O(1).
+            self.employees.append({})
             self.call_queue.append(deque())
+            self.idle.append([])
         self.call_map = {}
 
     def hire(self, employee):
-        self.employees[employee.rank].append(employee)
+        employee.hire_order = self.hire_count
+        self.hire_count += 1
+        self.employees[employee.rank][employee] = None
         self.employee_map[str(employee)] = employee
+        if self.stats is not None:
+            self.stats.staff_changed(employee.rank, 1)
+        self.mark_idle(employee)
 
     def remove(self, employee):
         employee_list = self.employees[employee.rank]
         if employee in employee_list:
-            employee_list.remove(employee)
+            del employee_list[employee]
             del self.employee_map[str(employee)]
+            employee.hire_order = None
+            if self.stats is not None:
+                self.stats.staff_changed(employee.rank, -1)
+            if employee in self.idle_respondents:
+                self.idle_respondents.remove(employee)
 
     def promote(self, employee, new_class):
         self.remove(employee)
         new_employee = new_class(employee.name)
         self.hire(new_employee)
 
+    def mark_idle(self, employee):
+        if employee.hire_order is not None and employee.talking_to is None:
+            heapq.heappush(self.idle[employee.rank], (employee.hire_order, employee))
+            if isinstance(employee, Respondent):
+                self.idle_respondents.push(employee, self.promotion_key(employee))
+
+    def mark_busy(self, employee):
+        heapq.heappop(self.idle[employee.rank])
+        if employee in self.idle_respondents:
+            self.idle_respondents.remove(employee)
+
+    @staticmethod
+    def promotion_key(respondent):
+        return (respondent.performance_rating, -respondent.hire_order)
+
+    def rating_changed(self, respondent):
+        if respondent in self.idle_respondents:
+            self.idle_respondents.update(respondent, self.promotion_key(respondent))
+
+    def next_idle(self, rank):
+        idle = self.idle[rank]
+        while idle:
+            hire_order, employee = idle[0]
+            if employee.hire_order == hire_order and employee.talking_to is None:
+                return employee
+            heapq.heappop(idle)
+        return None
+
     def add_call_to_queue(self, number):
         if number not in self.call_map:
             self.call_map[number] = CallInstance(number)
             self.call_queue[0].append(self.call_map[number])
+            if self.stats is not None:
+                self.stats.call_enqueued(self.call_map[number])
 
+    # Connects queued calls to idle employees and returns the calls that
+    # were connected.
     def resolve_queue(self, output):
+        connected = []
         for i in reversed(range(MAX_RANKS)):
             current_queue = self.call_queue[i]
-            current_employees = self.employees[i]
             while current_queue:
-                top = current_queue[0]
-                resolved = False
-                for employee in current_employees:
-                    if top.start_call(employee, output):
-                        resolved = True
-                        break
-                if resolved:
+                if current_queue[0].abandoned:
                     current_queue.popleft()
-                else:
+                    continue
+                employee = self.next_idle(i)
+                if employee is None or not current_queue[0].start_call(employee, output):
                     break
+                self.mark_busy(employee)
+                if self.stats is not None:
+                    self.stats.call_dispatched(current_queue[0])
+                connected.append(current_queue.popleft())
+        return connected
+
+    def end_call(self, call, output):
+        employee = call.talking_to
+        if call.end_call(output):
+            if self.stats is not None:
+                self.stats.call_released(employee, False)
+            self.mark_idle(employee)
+            return True
+        return False
 
     def escalate(self, phone, output):
         if phone in self.call_map:
             current_call = self.call_map[phone]
+            employee = current_call.talking_to
             if current_call.escalate(output):
+                if self.stats is not None:
+                    self.stats.call_released(employee, True)
+                    self.stats.call_enqueued(current_call)
+                self.mark_idle(employee)
                 self.call_queue[current_call.rank].append(current_call)
                 return True
         return False
 
-def simulate_call_center(instructions: List[List[str]]) -> List[str]:
-    call_center = CallCenter()
+def simulate_call_center(instructions: List[List[str]], stats: Optional[CallCenterStats] = None) -> List[str]:
+    return list(iter_call_center(instructions, stats))
+
+# Streams the output into sink (anything with write_lines, such as
+# line_sink.LineSink) and returns how many lines were written.
+def write_call_center(instructions: Iterable, sink, stats: Optional[CallCenterStats] = None) -> int:
+    return sink.write_lines(iter_call_center(instructions, stats))
+
+# Yields output lines as each instruction is processed. Instructions may be
+# lists or whitespace-separated strings, so a file can be passed directly.
+def iter_call_center(instructions: Iterable, stats: Optional[CallCenterStats] = None) -> Iterator[str]:
+    call_center = CallCenter(stats)
     output: List[str] = []
     for instruction in instructions:
+        if isinstance(instruction, str):
+            instruction = instruction.split()
+            if not instruction:
+                continue
         command, *params = instruction
         if command == "hire":
             call_center.hire(Employee.create_employee(*params))
@@ -179,7 +415,7 @@ def simulate_call_center(instructions: List[List[str]]) -> List[str]:
             number = params[0]
             if number in call_center.call_map:
                 current_call = call_center.call_map[number]
-                if current_call.end_call(output):
+                if call_center.end_call(current_call, output):
                     del call_center.call_map[number]
                     call_center.resolve_queue(output)
         elif command == "dispatch":
@@ -196,4 +432,117 @@ def simulate_call_center(instructions: List[List[str]]) -> List[str]:
                 worker = call_center.employee_map[worker_id]
                 if worker.talking_to is None:
                     worker.work(call_center, output)
-    return output
\ No newline at end of file
+        yield from output
+        output.clear()
+
+# Running count, mean and max of a stream of samples in O(1) memory.
+class RunningStats:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+class DiscardOutput:
+    def append(self, line):
+        pass
+
+class EventSimulationStats:
+    def __init__(self):
+        self.events = 0
+        self.arrivals = 0
+        self.completed = 0
+        self.escalated = 0
+        self.abandoned = [0] * MAX_RANKS
+        self.queue_wait = [RunningStats() for _ in range(MAX_RANKS)]
+
+ARRIVAL, FINISH, ABANDON = range(3)
+
+# Discrete-event run of a CallCenter on a timer heap. Callers arrive every
+# interarrival() time units, a call at rank r takes handle_time(r), finished
+# calls are escalated with escalation_probability, and a waiting caller hangs
+# up after patience() if given. Only live calls are kept, lines go to output
+# as they are produced (discarded by default) and queue waits are folded
+# into running per-rank stats, so memory does not grow with the event count.
+# A CallCenterStats passed as call_center_stats must be built with a
+# SimulatedClock; the run advances that clock from where it stands, so the
+# same stats can follow several runs back to back.
+def simulate_call_center_events(
+    staff: Dict[str, int],
+    interarrival: Callable[[], float],
+    handle_time: Callable[[int], float],
+    until: float,
+    escalation_probability: float = 0.0,
+    patience: Optional[Callable[[], float]] = None,
+    rng: Optional[random.Random] = None,
+    output=None,
+    call_center_stats: Optional[CallCenterStats] = None,
+) -> EventSimulationStats:
+    rng = rng or random.Random()
+    output = DiscardOutput() if output is None else output
+    clock = None
+    if call_center_stats is not None:
+        clock = call_center_stats.clock
+        if not isinstance(clock, SimulatedClock):
+            raise ValueError("call_center_stats needs a SimulatedClock")
+        start = clock.now
+    call_center = CallCenter(call_center_stats)
+    for role, count in staff.items():
+        for i in range(count):
+            call_center.hire(Employee.create_employee(role, f"{role.lower()}-{i}"))
+    stats = EventSimulationStats()
+    enqueued_at = {}
+    timers = [(interarrival(), 0, ARRIVAL, None)]
+    sequence = 1
+
+    def schedule(at, kind, payload):
+        nonlocal sequence
+        heapq.heappush(timers, (at, sequence, kind, payload))
+        sequence += 1
+
+    def enqueued(call, now):
+        enqueued_at[call] = now
+        if patience is not None:
+            schedule(now + patience(), ABANDON, (call, now))
+
+    while timers and timers[0][0] <= until:
+        now, _, kind, payload = heapq.heappop(timers)
+        if clock is not None:
+            clock.now = start + now
+        stats.events += 1
+        if kind == ARRIVAL:
+            number = f"call-{stats.arrivals}"
+            stats.arrivals += 1
+            call_center.add_call_to_queue(number)
+            enqueued(call_center.call_map[number], now)
+            schedule(now + interarrival(), ARRIVAL, None)
+        elif kind == FINISH:
+            if rng.random() < escalation_probability and call_center.escalate(payload.number, output):
+                stats.escalated += 1
+                enqueued(payload, now)
+            else:
+                call_center.end_call(payload, output)
+                del call_center.call_map[payload.number]
+                stats.completed += 1
+        elif kind == ABANDON:
+            call, since = payload
+            if enqueued_at.get(call) != since:
+                continue
+            call.abandoned = True
+            del enqueued_at[call]
+            del call_center.call_map[call.number]
+            stats.abandoned[call.rank] += 1
+        for call in call_center.resolve_queue(output):
+            stats.queue_wait[call.rank].add(now - enqueued_at.pop(call))
+            schedule(now + handle_time(call.rank), FINISH, call)
+    return stats
+
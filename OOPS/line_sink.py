@@ -0,0 +1,24 @@
+from typing import BinaryIO, Iterable
+
+# Buffered byte sink for the write_* entry points next to each simulation.
+# Lines are encoded newline-terminated and handed to raw in chunks of about
+# buffer_size bytes, so memory stays flat however long the replay.
+class LineSink:
+    def __init__(self, raw: BinaryIO, buffer_size: int = 1 << 16) -> None:
+        self.raw = raw
+        self.buffer_size = buffer_size
+
+    # Returns the number of lines written.
+    def write_lines(self, lines: Iterable[str]) -> int:
+        buffer = bytearray()
+        count = 0
+        for line in lines:
+            buffer += line.encode()
+            buffer += b"\n"
+            count += 1
+            if len(buffer) >= self.buffer_size:
+                self.raw.write(bytes(buffer))
+                buffer.clear()
+        if buffer:
+            self.raw.write(bytes(buffer))
+        return count
@@ -0,0 +1,46 @@
+# Memory and park/leave throughput of CompactParkingLot against the
+# object-per-spot RegularParkingLot, with half the spots occupied.
+#
+#     python bench_compact.py [spots] [operations]
+import random
+import sys
+import time
+import tracemalloc
+
+from parking_lot_free import Car, CompactParkingLot, RegularParkingLot
+
+SIZES = ["Small", "Medium", "Large"]
+COLORS = ["white", "black", "red", "blue", "silver"]
+BRANDS = ["BMW", "Nissan", "Toyota", "Ford", "Kia"]
+
+def build(lot_class, spots, rng):
+    tracemalloc.start()
+    lot = lot_class(spots)
+    for i in range(0, len(spots), 2):
+        lot.park(i, Car(rng.choice(SIZES), rng.choice(COLORS), rng.choice(BRANDS)))
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return lot, memory
+
+def churn(lot, spot_count, operations, rng):
+    steps = [(rng.randrange(spot_count), rng.randrange(spot_count), rng.choice(SIZES)) for _ in range(operations)]
+    start = time.perf_counter()
+    for leave_index, park_index, size in steps:
+        lot.leave(leave_index)
+        lot.park(park_index, Car(size, "white", "BMW"))
+    return 2 * operations / (time.perf_counter() - start)
+
+def main():
+    spot_count = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    operations = int(sys.argv[2]) if len(sys.argv) > 2 else 100_000
+    sizes = random.Random(0)
+    spots = [sizes.choice(SIZES) for _ in range(spot_count)]
+    for lot_class in (RegularParkingLot, CompactParkingLot):
+        rng = random.Random(1)
+        lot, memory = build(lot_class, spots, rng)
+        rate = churn(lot, spot_count, operations, rng)
+        print(f"{lot_class.__name__}: {memory / 2 ** 20:,.0f} MiB, {rate:,.0f} park/leave ops/s")
+        del lot
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+# Arrivals on a nearly full lot: the original RegularParkingLot.park, which
+# scans spots from the requested index (kept below), against the free-spot
+# tree in RegularParkingLot and CompactParkingLot. All three must park
+# every car in the same spot. parking_lot.ParkingLot, which wraps around to
+# the start of the lot, is timed the same way against its original scan.
+#
+#     python bench_free_spots.py [spots] [arrivals]
+import random
+import sys
+import time
+from typing import List, Optional
+
+import parking_lot
+from parking_lot_free import Car, CompactParkingLot, ParkingLot, ParkingSpot, RegularParkingLot
+
+# Original implementation, unchanged apart from its name.
+class ScanParkingLot(ParkingLot):
+    def __init__(self, spots: List[str]) -> None:
+        self.parking_spots: list[ParkingSpot] = []
+        self.__size = len(spots)
+        self.__free_spots = self.__size
+        for entry in spots:
+            self.parking_spots.append(ParkingSpot(entry))
+
+    def free_spots(self) -> int:
+        return self.__free_spots
+
+    def park(self, index: int, car: Car) -> bool:
+        for i in range(index, self.__size):
+            if self.parking_spots[i].park(car):
+                self.__free_spots -= 1
+                return True
+        return False
+
+    def leave(self, index: int) -> None:
+        if self.parking_spots[index].leave():
+            self.__free_spots += 1
+
+    def get_spot(self, index: int) -> Optional[Car]:
+        return self.parking_spots[index].parked_car
+
+# Original parking_lot.ParkingLot.park, unchanged apart from its name.
+class WrappingScanParkingLot(parking_lot.ParkingLot):
+    def __init__(self, spots: List[str]):
+        self.parking_spots: list[parking_lot.ParkingSpot] = []
+        for spot in spots:
+            self.parking_spots.append(parking_lot.ParkingSpot(size=spot))
+        self.__size = len(spots)
+        self.__free_spot = len(spots)
+
+    def free_spots(self) -> int:
+        return self.__free_spot
+
+    def leave(self, index: int):
+        if self.parking_spots[index].leave():
+            self.__free_spot += 1
+
+    def park(self, index: int, car: parking_lot.Car):
+        for i in range(index, self.__size):
+            if self.parking_spots[i].park(car=car):
+                self.__free_spot -= 1
+                return True
+        for i in range(index):
+            if self.parking_spots[i].park(car=car):
+                self.__free_spot -= 1
+                return True
+        return False
+
+SIZES = ["Small", "Medium", "Large"]
+
+def workload(spot_count, arrivals, car_class=Car):
+    rng = random.Random(0)
+    spots = [rng.choice(SIZES) for _ in range(spot_count)]
+    # Fill every spot with a car of its own size, then free one spot per
+    # arrival so the lot stays one car away from full.
+    fill = [(i, car_class(size, "white", "fill")) for i, size in enumerate(spots)]
+    churn = []
+    for n in range(arrivals):
+        churn.append((rng.randrange(spot_count), rng.randrange(spot_count), car_class("Small", "red", str(n))))
+    return spots, fill, churn
+
+def run(lot_class, spots, fill, churn):
+    lot = lot_class(spots)
+    for index, car in fill:
+        lot.park(index, car)
+    placed = []
+    start = time.perf_counter()
+    for leave_index, park_index, car in churn:
+        lot.leave(leave_index)
+        placed.append(lot.park(park_index, car))
+    elapsed = time.perf_counter() - start
+    # parking_lot.ParkingLot has no get_spot; its spots print their car.
+    spot = lot.get_spot if hasattr(lot, "get_spot") else lot.parking_spots.__getitem__
+    return elapsed, placed, [str(spot(i)) for i in range(0, len(spots), 97)]
+
+def compare(module, lot_classes, spot_count, arrivals, car_class):
+    print(f"{module}, {spot_count}-spot lot kept nearly full:")
+    spots, fill, churn = workload(spot_count, arrivals, car_class)
+    results = {}
+    for lot_class in lot_classes:
+        elapsed, placed, sample = run(lot_class, spots, fill, churn)
+        results[lot_class.__name__] = (placed, sample)
+        print(f"  {lot_class.__name__}: {arrivals / elapsed:,.0f} arrivals/s")
+    assert len({repr(result) for result in results.values()}) == 1, "lots placed cars differently"
+
+def main():
+    spot_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    arrivals = int(sys.argv[2]) if len(sys.argv) > 2 else 2_000
+    compare("parking_lot_free", (ScanParkingLot, RegularParkingLot, CompactParkingLot), spot_count, arrivals, Car)
+    compare("parking_lot", (WrappingScanParkingLot, parking_lot.ParkingLot), spot_count, arrivals, parking_lot.Car)
+
+if __name__ == "__main__":
+    main()
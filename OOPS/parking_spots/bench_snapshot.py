@@ -0,0 +1,100 @@
+# Snapshot and restore of RegularParkingLot and UnboundedParkingLot. Times
+# building a large lot, snapshotting it and restoring it, then checks the
+# restored lot against the original: both take the same random operations
+# and must answer every query the same. The restored lot is then snapshotted
+# over its own file and checked against a restore of that.
+#
+#     python bench_snapshot.py [spots] [operations]
+import os
+import random
+import sys
+import tempfile
+import time
+
+from parking_lot_free import Car, CarSize, RegularParkingLot, UnboundedParkingLot, restore_parking_lot
+
+SIZES = ["Small", "Medium", "Large"]
+
+def timed(label, function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    print(f"  {label}: {time.perf_counter() - start:.3f}s")
+    return result
+
+def fill(lot, spot_count, rng):
+    for n in range(spot_count):
+        lot.park(rng.randrange(spot_count), Car(rng.choice(SIZES), rng.choice(["red", "blue"]), str(n % 100)))
+    for _ in range(spot_count // 3):
+        lot.leave(rng.randrange(spot_count))
+
+def regular_state(lot, spot_count, rng):
+    start = rng.randrange(spot_count)
+    end = rng.randrange(start, spot_count + 1)
+    size = rng.choice([None, *CarSize])
+    index = rng.randrange(-spot_count, spot_count)
+    return (
+        lot.free_spots(),
+        str(lot.get_spot(index)),
+        str(lot.parking_spots[index]),
+        lot.free_spots_in(start, end, size),
+        lot.occupied_spots_in(start, end, size),
+    )
+
+def unbounded_state(lot, length, rng):
+    index = rng.randrange(length)
+    return (
+        lot.free_spots(),
+        [lot.free_spots_for(size) for size in CarSize],
+        lot.largest_gap(),
+        str(lot.get_spot(index)),
+    )
+
+def compare(original, restored, spot_count, operations, state, park_best_fit=False):
+    rng = random.Random(2)
+    for n in range(operations):
+        seed = rng.random()
+        # Queries first, so the restored lot answers some from the mapped file.
+        assert state(original, spot_count, random.Random(seed)) == state(restored, spot_count, random.Random(seed))
+        if n < operations // 10:
+            continue
+        index = rng.randrange(spot_count)
+        car = Car(rng.choice(SIZES), "green", str(n))
+        kind = rng.random()
+        if kind < 0.4:
+            assert original.park(index, car) == restored.park(index, car)
+        elif kind < 0.5 and park_best_fit:
+            assert original.park_best_fit(car) == restored.park_best_fit(car)
+        else:
+            original.leave(index)
+            restored.leave(index)
+
+def check(label, original, state, spot_count, operations, path, park_best_fit=False):
+    print(label)
+    timed("snapshot", original.snapshot, path)
+    restored = timed("restore", restore_parking_lot, path)
+    assert type(restored) is type(original)
+    compare(original, restored, spot_count, operations, state, park_best_fit)
+    # Overwriting the file the restored lot maps must not disturb it, and
+    # the new file must restore to the same state.
+    restored.snapshot(path)
+    again = restore_parking_lot(path)
+    compare(restored, again, spot_count, operations, state, park_best_fit)
+    restored.close()
+    again.close()
+
+def main():
+    spot_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    operations = int(sys.argv[2]) if len(sys.argv) > 2 else 2_000
+    rng = random.Random(0)
+    spots = [rng.choice(SIZES) for _ in range(spot_count)]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "lot")
+        regular = timed("build RegularParkingLot", RegularParkingLot, spots)
+        fill(regular, spot_count, rng)
+        check("RegularParkingLot", regular, regular_state, spot_count, operations, path)
+        unbounded = timed("build UnboundedParkingLot", UnboundedParkingLot, spot_count, 1, 2, 3)
+        fill(unbounded, spot_count, rng)
+        check("UnboundedParkingLot", unbounded, unbounded_state, spot_count, operations, path, park_best_fit=True)
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 from enum import Enum
-from typing import Optional, List
+from typing import Iterable, Iterator, Optional, List
 
 class CarSize(Enum):
     SMALL = 0
@@ -47,6 +47,44 @@ class ParkingSpot:
             return str(self.vehical_parked)
         return "Empty"
 
+# Segment tree over spot positions. A leaf holds the size value of a free
+# spot (or -1 once it is taken) and every inner node the max of its
+# children, so "first free spot at or after index that fits" is O(log n).
+class FreeSpotTree:
+    def __init__(self, sizes: List[int]) -> None:
+        self.size = 1
+        while self.size < len(sizes):
+            self.size *= 2
+        self.tree = [-1] * (2 * self.size)
+        self.tree[self.size : self.size + len(sizes)] = sizes
+        for i in range(self.size - 1, 0, -1):
+            self.tree[i] = max(self.tree[2 * i], self.tree[2 * i + 1])
+
+    def update(self, index: int, value: int) -> None:
+        i = index + self.size
+        self.tree[i] = value
+        i //= 2
+        while i:
+            self.tree[i] = max(self.tree[2 * i], self.tree[2 * i + 1])
+            i //= 2
+
+    # Return the first position >= start whose value is at least min_value,
+    # or -1 if there is none.
+    def find_first(self, start: int, min_value: int) -> int:
+        if start >= self.size:
+            return -1
+        i = start + self.size
+        while self.tree[i] < min_value:
+            # Climb while i is a right child, then step to the next subtree.
+            while i & 1:
+                i //= 2
+            if i == 0:
+                return -1
+            i += 1
+        while i < self.size:
+            i = 2 * i if self.tree[2 * i] >= min_value else 2 * i + 1
+        return i - self.size
+
 class ParkingLot:
     def __init__(self, spots: List[str]):
         self.parking_spots: list[ParkingSpot] = []
@@ -54,29 +92,42 @@ class ParkingLot:
             self.parking_spots.append(ParkingSpot(size=spot))
         self.__size = len(spots)
         self.__free_spot = len(spots)
+        self.free_spot_tree = FreeSpotTree([spot.size.value for spot in self.parking_spots])
     
     def free_spots(self) -> int:
         return self.__free_spot
     
     def leave(self, index: int):
-        if self.parking_spots[index].leave():
+        spot = self.parking_spots[index]
+        if spot.leave():
             self.__free_spot += 1
+            self.free_spot_tree.update(index % self.__size, spot.size.value)
     
     def park(self, index: int, car: Car):
-        for i in range(index, self.__size):
-            if self.parking_spots[i].park(car=car):
-                self.__free_spot -= 1
-                return True
-        for i in range(index):
-            if self.parking_spots[i].park(car=car):
-                self.__free_spot -= 1
-                return True
-        return False
+        i = self.free_spot_tree.find_first(max(index, 0), car.size.value)
+        if i == -1:
+            i = self.free_spot_tree.find_first(0, car.size.value)
+        if i == -1 or not self.parking_spots[i].park(car=car):
+            return False
+        self.__free_spot -= 1
+        self.free_spot_tree.update(i, -1)
+        return True
 
 def parking_system(spots: List[str], instructions: List[List[str]]) -> List[str]:
-    ans = []
+    return list(iter_parking_system(spots, instructions))
+
+# Output goes to sink (see line_sink.LineSink); returns the line count.
+def write_parking_system(spots: List[str], instructions: Iterable, sink) -> int:
+    return sink.write_lines(iter_parking_system(spots, instructions))
+
+# Lazy version of parking_system; string instructions are split on spaces.
+def iter_parking_system(spots: List[str], instructions: Iterable) -> Iterator[str]:
     p = ParkingLot(spots=spots)
     for instruction in instructions:
+        if isinstance(instruction, str):
+            instruction = instruction.split()
+            if not instruction:
+                continue
         operation, *args = instruction
         if operation == "park":
             slot, *car_args = args
@@ -84,19 +135,18 @@ def parking_system(spots: List[str], instructions: List[List[str]]) -> List[str]
         elif operation == "remove":
             p.leave(int(args[0]))
         elif operation == "print":
-            output = str(p.parking_spots[int(args[0])])
-            ans.append(output)
+            yield str(p.parking_spots[int(args[0])])
         elif operation == "print_free_spots":
-            ans.append(str(p.free_spots()))
-    return ans
+            yield str(p.free_spots())
 
 
-instructions = [
-  ["park", "1", "Small", "Silver", "BMW"],
-  ["park", "1", "Large", "Black", "Nissan"],
-  ["print", "1"],
-  ["print", "2"],
-  ["print", "3"],
-]
-n = 5
-parking_system(instructions=instructions, n=n)
\ No newline at end of file
+if __name__ == "__main__":
+    instructions = [
+      ["park", "1", "Small", "Silver", "BMW"],
+      ["park", "1", "Large", "Black", "Nissan"],
+      ["print", "1"],
+      ["print", "2"],
+      ["print", "3"],
+    ]
+    spots = ["Small", "Medium", "Large", "Large", "Small"]
+    print(parking_system(spots=spots, instructions=instructions))
@@ -1,6 +1,14 @@
+import heapq
+import mmap
+import os
+import random
+import struct
+from array import array
 from bisect import bisect_right
+from contextlib import contextmanager
 from enum import Enum
-from typing import List, Optional
+from threading import Lock
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
 
 class CarSize(Enum):
     SMALL = 0
@@ -48,6 +56,74 @@ class ParkingSpot:
             return str(self.parked_car)
         return "Empty"
 
+# Segment tree over spot positions. A leaf holds the size value of a free
+# spot (or -1 once it is taken) and every inner node the max of its
+# children, so "first free spot at or after index that fits" is O(log n).
+class FreeSpotTree:
+    def __init__(self, sizes) -> None:
+        self.size = 1
+        while self.size < len(sizes):
+            self.size *= 2
+        self.tree = array("b", [-1]) * (2 * self.size)
+        self.tree[self.size : self.size + len(sizes)] = array("b", sizes)
+        for i in range(self.size - 1, 0, -1):
+            self.tree[i] = max(self.tree[2 * i], self.tree[2 * i + 1])
+
+    def update(self, index: int, value: int) -> None:
+        i = index + self.size
+        self.tree[i] = value
+        i //= 2
+        while i:
+            self.tree[i] = max(self.tree[2 * i], self.tree[2 * i + 1])
+            i //= 2
+
+    # Return the first position >= start whose value is at least min_value,
+    # or -1 if there is none.
+    def find_first(self, start: int, min_value: int) -> int:
+        if start >= self.size:
+            return -1
+        i = start + self.size
+        while self.tree[i] < min_value:
+            # Climb while i is a right child, then step to the next subtree.
+            while i & 1:
+                i //= 2
+            if i == 0:
+                return -1
+            i += 1
+        while i < self.size:
+            i = 2 * i if self.tree[2 * i] >= min_value else 2 * i + 1
+        return i - self.size
+
+# Fenwick tree over spot positions answering prefix and range sums in
+# O(log n), updated one spot at a time.
+class FenwickTree:
+    def __init__(self, values: List[int]) -> None:
+        self.size = len(values)
+        self.tree = array("i", [0]) * (self.size + 1)
+        for i, value in enumerate(values, 1):
+            self.tree[i] += value
+            parent = i + (i & -i)
+            if parent <= self.size:
+                self.tree[parent] += self.tree[i]
+
+    def add(self, index: int, delta: int) -> None:
+        i = index + 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    # Sum of values[0:end].
+    def prefix(self, end: int) -> int:
+        total = 0
+        i = min(max(end, 0), self.size)
+        while i:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def range_sum(self, start: int, end: int) -> int:
+        return max(self.prefix(end) - self.prefix(start), 0)
+
 class ParkingInterval:
     def __init__(self, start: int, end: int, car: Optional[Car]) -> None:
         self.start = start
@@ -86,6 +162,366 @@ class ParkingInterval:
             return_list.append(ParkingInterval(car_interval.end, self.end, None))
         return return_list
 
+# Links nodes, already in key order, into a treap in O(n): each node hangs
+# below the nearest earlier node with a higher priority, taking over the
+# run of lower-priority nodes just before it as its left subtree.
+def build_treap(nodes: list):
+    stack: list = []
+    for node in nodes:
+        last = None
+        while stack and stack[-1].priority < node.priority:
+            last = stack.pop()
+        node.left = last
+        if stack:
+            stack[-1].right = node
+        stack.append(node)
+    return stack[0] if stack else None
+
+class IntervalNode:
+    __slots__ = ("interval", "priority", "left", "right", "max_gap")
+
+    def __init__(self, interval: ParkingInterval) -> None:
+        self.interval = interval
+        self.priority = random.random()
+        self.left: Optional[IntervalNode] = None
+        self.right: Optional[IntervalNode] = None
+        # Size of the largest free interval in this subtree (-1 if none).
+        self.max_gap = -1
+
+    # Recompute max_gap from the children, returning whether it changed.
+    def update(self) -> bool:
+        interval = self.interval
+        gap = interval.end - interval.start if interval.car is None else -1
+        if self.left and self.left.max_gap > gap:
+            gap = self.left.max_gap
+        if self.right and self.right.max_gap > gap:
+            gap = self.right.max_gap
+        if gap == self.max_gap:
+            return False
+        self.max_gap = gap
+        return True
+
+# Treap of parking intervals ordered by start. Every node also tracks the
+# largest free interval below it, so insert, remove, lookups and first-fit
+# searches are all O(log n) expected.
+class IntervalTree:
+    def __init__(self) -> None:
+        self.root: Optional[IntervalNode] = None
+        self.count = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    # Tree over intervals already sorted by start, built in O(n).
+    @classmethod
+    def from_sorted(cls, intervals: List[ParkingInterval]) -> "IntervalTree":
+        tree = cls()
+        nodes = [IntervalNode(interval) for interval in intervals]
+        tree.root = build_treap(nodes)
+        tree.count = len(nodes)
+        # Parents come before their children in preorder, so walking it
+        # backwards fills in max_gap bottom-up.
+        preorder = []
+        stack = [tree.root] if tree.root else []
+        while stack:
+            node = stack.pop()
+            preorder.append(node)
+            stack.extend(child for child in (node.left, node.right) if child)
+        for node in reversed(preorder):
+            node.update()
+        return tree
+
+    def __iter__(self):
+        stack: List[IntervalNode] = []
+        node = self.root
+        while stack or node:
+            while node:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            yield node.interval
+            node = node.right
+
+    # Split into (starts < key, starts >= key).
+    def split(self, node: Optional[IntervalNode], key: int):
+        if node is None:
+            return None, None
+        if node.interval.start < key:
+            node.right, right = self.split(node.right, key)
+            node.update()
+            return node, right
+        left, node.left = self.split(node.left, key)
+        node.update()
+        return left, node
+
+    def merge(self, left: Optional[IntervalNode], right: Optional[IntervalNode]):
+        if left is None:
+            return right
+        if right is None:
+            return left
+        if left.priority > right.priority:
+            left.right = self.merge(left.right, right)
+            left.update()
+            return left
+        right.left = self.merge(left, right.left)
+        right.update()
+        return right
+
+    # Nodes from the root down to the node starting at key (or to where it
+    # would hang), followed by that node or None.
+    def path_to(self, key: int):
+        path = []
+        node = self.root
+        while node and node.interval.start != key:
+            path.append(node)
+            node = node.left if key < node.interval.start else node.right
+        return path, node
+
+    # Hang new where the subtree for key used to be, then refresh max_gap
+    # upwards until it stops changing.
+    def relink(self, path: List[IntervalNode], key: int, new: Optional[IntervalNode]) -> None:
+        if not path:
+            self.root = new
+        elif key < path[-1].interval.start:
+            path[-1].left = new
+        else:
+            path[-1].right = new
+        for node in reversed(path):
+            if not node.update():
+                break
+
+    def insert(self, interval: ParkingInterval) -> None:
+        new = IntervalNode(interval)
+        path = []
+        node = self.root
+        while node and node.priority > new.priority:
+            path.append(node)
+            node = node.left if interval.start < node.interval.start else node.right
+        new.left, new.right = self.split(node, interval.start)
+        new.update()
+        self.relink(path, interval.start, new)
+        self.count += 1
+
+    def remove(self, interval: ParkingInterval) -> None:
+        path, node = self.path_to(interval.start)
+        if node is None:
+            return
+        self.relink(path, interval.start, self.merge(node.left, node.right))
+        self.count -= 1
+
+    # Swap in an interval with the same start without reshaping the tree.
+    def replace(self, interval: ParkingInterval) -> None:
+        path, node = self.path_to(interval.start)
+        node.interval = interval
+        node.update()
+        self.relink(path, interval.start, node)
+
+    def find(self, index: int) -> Optional[ParkingInterval]:
+        node = self.root
+        found = None
+        while node:
+            if node.interval.start <= index:
+                found = node.interval
+                node = node.right
+            else:
+                node = node.left
+        return found if found else self.first()
+
+    def first(self) -> Optional[ParkingInterval]:
+        node = self.root
+        while node and node.left:
+            node = node.left
+        return node.interval if node else None
+
+    def successor(self, interval: ParkingInterval) -> Optional[ParkingInterval]:
+        node = self.root
+        found = None
+        while node:
+            if node.interval.start > interval.start:
+                found = node.interval
+                node = node.left
+            else:
+                node = node.right
+        return found
+
+    def predecessor(self, interval: ParkingInterval) -> Optional[ParkingInterval]:
+        node = self.root
+        found = None
+        while node:
+            if node.interval.start < interval.start:
+                found = node.interval
+                node = node.right
+            else:
+                node = node.left
+        return found
+
+    # First free interval starting at or after start that is at least size long.
+    def first_fit(self, start: int, size: int) -> Optional[ParkingInterval]:
+        # Nodes at or after start along the search path, smallest last.
+        pending = []
+        node = self.root
+        while node:
+            if node.interval.start < start:
+                node = node.right
+            else:
+                pending.append(node)
+                node = node.left
+        while pending:
+            node = pending.pop()
+            interval = node.interval
+            if interval.car is None and interval.end - interval.start >= size:
+                return interval
+            node = node.right
+            if node is None or node.max_gap < size:
+                continue
+            while True:
+                if node.left and node.left.max_gap >= size:
+                    node = node.left
+                    continue
+                interval = node.interval
+                if interval.car is None and interval.end - interval.start >= size:
+                    return interval
+                node = node.right
+        return None
+
+class GapNode:
+    __slots__ = ("key", "interval", "priority", "left", "right")
+
+    def __init__(self, interval: ParkingInterval) -> None:
+        self.key = (interval.size, interval.start)
+        self.interval = interval
+        self.priority = random.random()
+        self.left: Optional[GapNode] = None
+        self.right: Optional[GapNode] = None
+
+# Treap of the free intervals ordered by (size, start), so the smallest gap
+# that still fits a car is found in O(log n) expected.
+class GapTree:
+    def __init__(self) -> None:
+        self.root: Optional[GapNode] = None
+
+    # Tree over free intervals in any order, built after one sort.
+    @classmethod
+    def from_intervals(cls, intervals: Iterable[ParkingInterval]) -> "GapTree":
+        tree = cls()
+        tree.root = build_treap(sorted((GapNode(interval) for interval in intervals), key=lambda node: node.key))
+        return tree
+
+    def split(self, node: Optional[GapNode], key):
+        if node is None:
+            return None, None
+        if node.key < key:
+            node.right, right = self.split(node.right, key)
+            return node, right
+        left, node.left = self.split(node.left, key)
+        return left, node
+
+    def merge(self, left: Optional[GapNode], right: Optional[GapNode]):
+        if left is None:
+            return right
+        if right is None:
+            return left
+        if left.priority > right.priority:
+            left.right = self.merge(left.right, right)
+            return left
+        right.left = self.merge(left, right.left)
+        return right
+
+    def insert(self, interval: ParkingInterval) -> None:
+        left, right = self.split(self.root, (interval.size, interval.start))
+        self.root = self.merge(self.merge(left, GapNode(interval)), right)
+
+    def remove(self, interval: ParkingInterval) -> None:
+        left, right = self.split(self.root, (interval.size, interval.start))
+        _, right = self.split(right, (interval.size, interval.start + 1))
+        self.root = self.merge(left, right)
+
+    # Smallest free interval at least size long, leftmost on ties.
+    def ceiling(self, size: int) -> Optional[ParkingInterval]:
+        node = self.root
+        found = None
+        while node:
+            if node.key[0] >= size:
+                found = node.interval
+                node = node.left
+            else:
+                node = node.right
+        return found
+
+# Snapshot layout: a fixed header followed by raw column arrays, each padded
+# to 8 bytes so they can be viewed straight out of a memory map.
+SNAPSHOT_MAGIC = b"PLOT"
+SPOTS_SNAPSHOT = 0
+UNBOUNDED_SNAPSHOT = 1
+REGULAR_SNAPSHOT = 2
+SNAPSHOT_HEADER = struct.Struct("<4sB3xQQQQQQ")
+
+def write_padded(f: BinaryIO, data: bytes) -> None:
+    f.write(data)
+    f.write(b"\0" * (-len(data) % 8))
+
+# Writes a snapshot to a temporary file and renames it over path. A lot
+# restored from the old file keeps its mapping of the old inode instead of
+# seeing the file truncated underneath it.
+@contextmanager
+def snapshot_file(path: str) -> Iterator[BinaryIO]:
+    temp_path = path + ".tmp"
+    try:
+        with open(temp_path, "wb") as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+class SnapshotReader:
+    def __init__(self, path: str) -> None:
+        with open(path, "rb") as f:
+            # ACCESS_COPY keeps later writes private to this process.
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        self.view = memoryview(self.map)
+        # Every view handed out, so close() can release them before the map.
+        self.views: List[memoryview] = []
+        self.offset = 0
+
+    def header(self):
+        values = SNAPSHOT_HEADER.unpack_from(self.map, self.offset)
+        if values[0] != SNAPSHOT_MAGIC:
+            raise ValueError("not a parking lot snapshot")
+        self.offset += SNAPSHOT_HEADER.size
+        return values[1:]
+
+    def take(self, length: int, typecode: Optional[str] = None) -> memoryview:
+        view = self.view[self.offset : self.offset + length]
+        self.views.append(view)
+        if typecode is not None:
+            view = view.cast(typecode)
+            self.views.append(view)
+        self.offset += length + (-length % 8)
+        return view
+
+    def take_array(self, typecode: str, count: int) -> array:
+        values = array(typecode)
+        values.frombytes(self.take(count * values.itemsize))
+        return values
+
+    def take_fenwick(self, size: int) -> "FenwickTree":
+        tree = FenwickTree.__new__(FenwickTree)
+        tree.size = size
+        tree.tree = self.take((size + 1) * 4, "i")
+        return tree
+
+    # Unmaps the file; any view taken from it is unusable afterwards.
+    def close(self) -> None:
+        for view in reversed(self.views):
+            view.release()
+        self.views.clear()
+        self.view.release()
+        self.map.close()
+
 class ParkingLot:
     def free_spots(self) -> int:
         raise NotImplementedError
@@ -106,24 +542,295 @@ class RegularParkingLot(ParkingLot):
         self.__free_spots = self.__size
         for entry in spots:
             self.parking_spots.append(ParkingSpot(entry))
+        self.free_spot_tree = FreeSpotTree([spot.size.value for spot in self.parking_spots])
+        # Per-size spot totals never change; per-size free counts do.
+        self.spot_counts = {
+            size: FenwickTree([spot.size == size for spot in self.parking_spots])
+            for size in CarSize
+        }
+        self.free_counts = {
+            size: FenwickTree([spot.size == size for spot in self.parking_spots])
+            for size in CarSize
+        }
+        # Set by restore(); its mapping backs the spot columns.
+        self.snapshot_reader: Optional[SnapshotReader] = None
+
+    # Unmaps the snapshot a restored lot reads from. The lot cannot be used
+    # afterwards.
+    def close(self) -> None:
+        if self.snapshot_reader is not None:
+            self.snapshot_reader.close()
+            self.snapshot_reader = None
 
     def free_spots(self) -> int:
         return self.__free_spots
 
+    # Free spots in [start, end), of one size or of every size.
+    def free_spots_in(self, start: int, end: int, size: Optional[CarSize] = None) -> int:
+        sizes = [size] if size is not None else list(CarSize)
+        return sum(self.free_counts[s].range_sum(start, end) for s in sizes)
+
+    def occupied_spots_in(self, start: int, end: int, size: Optional[CarSize] = None) -> int:
+        sizes = [size] if size is not None else list(CarSize)
+        return sum(
+            self.spot_counts[s].range_sum(start, end) - self.free_counts[s].range_sum(start, end)
+            for s in sizes
+        )
+
     def park(self, index: int, car: Car) -> bool:
-        for i in range(index, self.__size):
-            if self.parking_spots[i].park(car):
-                self.__free_spots -= 1
-                return True
-        return False
+        i = self.free_spot_tree.find_first(max(index, 0), car.size.value)
+        if i == -1 or not self.parking_spots[i].park(car):
+            return False
+        self.__free_spots -= 1
+        self.free_spot_tree.update(i, -1)
+        self.free_counts[self.parking_spots[i].size].add(i, -1)
+        return True
 
     def leave(self, index: int) -> None:
-        if self.parking_spots[index].leave():
+        spot = self.parking_spots[index]
+        if spot.leave():
+            index %= self.__size
             self.__free_spots += 1
+            self.free_spot_tree.update(index, spot.size.value)
+            self.free_counts[spot.size].add(index, 1)
 
     def get_spot(self, index: int) -> Optional[Car]:
         return self.parking_spots[index].parked_car
 
+    # Written in the CompactParkingLot layout followed by the per-size
+    # counters, so a restored lot answers range queries without rebuilding.
+    def snapshot(self, path: str) -> None:
+        compact = CompactParkingLot([SIZE_STRING[spot.size] for spot in self.parking_spots])
+        for i, spot in enumerate(self.parking_spots):
+            if spot.parked_car:
+                compact.park(i, spot.parked_car)
+        with snapshot_file(path) as f:
+            compact.write(f, REGULAR_SNAPSHOT)
+            for counts in (self.spot_counts, self.free_counts):
+                for size in CarSize:
+                    write_padded(f, counts[size].tree.tobytes())
+
+    # The free-spot tree and counters stay views over the mapped file, and
+    # parking_spots builds a ParkingSpot the first time an index is touched,
+    # so a large lot is usable at once. The lot owns the reader until close().
+    @classmethod
+    def restore(cls, reader: SnapshotReader) -> "RegularParkingLot":
+        compact = CompactParkingLot.restore(reader)
+        compact.snapshot_reader = None
+        spot_count = len(compact.spot_sizes)
+        lot = cls.__new__(cls)
+        lot.snapshot_reader = reader
+        lot.parking_spots = MappedSpots(compact)
+        lot.__size = spot_count
+        lot.__free_spots = compact.free_spots()
+        lot.free_spot_tree = compact.free_spot_tree
+        lot.spot_counts = {size: reader.take_fenwick(spot_count) for size in CarSize}
+        lot.free_counts = {size: reader.take_fenwick(spot_count) for size in CarSize}
+        return lot
+
+# Stands in for RegularParkingLot.parking_spots after a restore. Spots are
+# read from a CompactParkingLot over the mapped file and kept once built, so
+# later changes go to the ParkingSpot like in a freshly built lot.
+class MappedSpots:
+    def __init__(self, lot: "CompactParkingLot") -> None:
+        self.lot = lot
+        self.spots: Dict[int, ParkingSpot] = {}
+
+    def __len__(self) -> int:
+        return len(self.lot.spot_sizes)
+
+    def __getitem__(self, index: int) -> ParkingSpot:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("parking spot index out of range")
+        spot = self.spots.get(index)
+        if spot is None:
+            spot = ParkingSpot(SIZE_STRING[CarSize(self.lot.spot_sizes[index])])
+            spot.parked_car = self.lot.get_spot(index)
+            self.spots[index] = spot
+        return spot
+
+    def __iter__(self) -> Iterator[ParkingSpot]:
+        return (self[i] for i in range(len(self)))
+
+# Thread-safe facade splitting a lot into zones, each a RegularParkingLot
+# behind its own lock. An arrival that finds its zone full moves on to the
+# next zone, holding only one zone lock at a time. By default it stops at the
+# end of the lot like RegularParkingLot, placing cars the same way; with
+# wrap=True it carries on from the first zone.
+class ShardedParkingLot(ParkingLot):
+    def __init__(self, spots: List[str], zones: int = 16, wrap: bool = False) -> None:
+        self.size = len(spots)
+        self.zone_size = max(1, -(-len(spots) // zones))
+        self.zones = [
+            RegularParkingLot(spots[i : i + self.zone_size])
+            for i in range(0, len(spots), self.zone_size)
+        ]
+        self.locks = [Lock() for _ in self.zones]
+        self.wrap = wrap
+
+    def free_spots(self) -> int:
+        return sum(zone.free_spots() for zone in self.zones)
+
+    # Zone and offset of a spot index; negative indices count from the end
+    # and anything out of range raises IndexError, as with a list of spots.
+    def locate(self, index: int) -> Tuple[int, int]:
+        if index < 0:
+            index += self.size
+        if not 0 <= index < self.size:
+            raise IndexError("parking spot index out of range")
+        return divmod(index, self.zone_size)
+
+    def park(self, index: int, car: Car) -> bool:
+        index = max(index, 0)
+        first = index // self.zone_size
+        order = [(z, index - z * self.zone_size if z == first else 0) for z in range(first, len(self.zones))]
+        if self.wrap:
+            order += [(z, 0) for z in range(min(first, len(self.zones) - 1) + 1)]
+        for z, start in order:
+            # Unlocked peek at the zone's largest free spot, so full zones are
+            # passed over without taking their locks.
+            if self.zones[z].free_spot_tree.tree[1] < car.size.value:
+                continue
+            with self.locks[z]:
+                if self.zones[z].park(start, car):
+                    return True
+        return False
+
+    def leave(self, index: int) -> None:
+        z, offset = self.locate(index)
+        with self.locks[z]:
+            self.zones[z].leave(offset)
+
+    def get_spot(self, index: int) -> Optional[Car]:
+        z, offset = self.locate(index)
+        with self.locks[z]:
+            return self.zones[z].get_spot(offset)
+
+# RegularParkingLot without a Python object per spot. Spot sizes live in a
+# bytearray and each spot holds a handle into column arrays describing the
+# parked cars; colors and brands are interned into small vocabularies.
+class CompactParkingLot(ParkingLot):
+    def __init__(self, spots: List[str]) -> None:
+        self.spot_sizes = bytearray(SIZES[entry].value for entry in spots)
+        self.spot_cars = array("i", [-1]) * len(spots)
+        self.__size = len(spots)
+        self.__free_spots = self.__size
+        self.free_spot_tree = FreeSpotTree(self.spot_sizes)
+        self.car_sizes = bytearray()
+        self.car_colors = array("i")
+        self.car_brands = array("i")
+        self.free_handles: List[int] = []
+        self.words: List[str] = []
+        self.word_ids: Dict[str, int] = {}
+        # Set by restore(); its mapping backs the spot columns.
+        self.snapshot_reader: Optional[SnapshotReader] = None
+
+    # Unmaps the snapshot a restored lot reads from. The lot cannot be used
+    # afterwards.
+    def close(self) -> None:
+        if self.snapshot_reader is not None:
+            self.snapshot_reader.close()
+            self.snapshot_reader = None
+
+    def intern(self, word: str) -> int:
+        if word not in self.word_ids:
+            self.word_ids[word] = len(self.words)
+            self.words.append(word)
+        return self.word_ids[word]
+
+    def new_handle(self, car: Car) -> int:
+        color, brand = self.intern(car.color), self.intern(car.brand)
+        if self.free_handles:
+            handle = self.free_handles.pop()
+            self.car_sizes[handle] = car.size.value
+            self.car_colors[handle] = color
+            self.car_brands[handle] = brand
+            return handle
+        self.car_sizes.append(car.size.value)
+        self.car_colors.append(color)
+        self.car_brands.append(brand)
+        return len(self.car_sizes) - 1
+
+    def free_spots(self) -> int:
+        return self.__free_spots
+
+    def park(self, index: int, car: Car) -> bool:
+        i = self.free_spot_tree.find_first(max(index, 0), car.size.value)
+        if i == -1:
+            return False
+        self.spot_cars[i] = self.new_handle(car)
+        self.__free_spots -= 1
+        self.free_spot_tree.update(i, -1)
+        return True
+
+    def leave(self, index: int) -> None:
+        handle = self.spot_cars[index]
+        if handle != -1:
+            self.spot_cars[index] = -1
+            self.free_handles.append(handle)
+            self.__free_spots += 1
+            self.free_spot_tree.update(index % self.__size, self.spot_sizes[index])
+
+    def get_spot(self, index: int) -> Optional[Car]:
+        handle = self.spot_cars[index]
+        if handle == -1:
+            return None
+        return Car(
+            SIZE_STRING[CarSize(self.car_sizes[handle])],
+            self.words[self.car_colors[handle]],
+            self.words[self.car_brands[handle]],
+        )
+
+    def snapshot(self, path: str) -> None:
+        with snapshot_file(path) as f:
+            self.write(f, SPOTS_SNAPSHOT)
+
+    def write(self, f: BinaryIO, kind: int) -> None:
+        words = "\0".join(self.words).encode()
+        f.write(SNAPSHOT_HEADER.pack(
+            SNAPSHOT_MAGIC,
+            kind,
+            self.__size,
+            self.free_spot_tree.size,
+            len(self.car_sizes),
+            len(self.free_handles),
+            len(words),
+            self.__free_spots,
+        ))
+        write_padded(f, bytes(self.spot_sizes))
+        write_padded(f, self.spot_cars.tobytes())
+        write_padded(f, self.free_spot_tree.tree.tobytes())
+        write_padded(f, bytes(self.car_sizes))
+        write_padded(f, self.car_colors.tobytes())
+        write_padded(f, self.car_brands.tobytes())
+        write_padded(f, array("i", self.free_handles).tobytes())
+        write_padded(f, words)
+
+    # Spot sizes, occupancy and the free-spot tree stay views over the
+    # mapped file and are paged in as spots are touched; only the car
+    # columns are copied out. The lot owns the reader until close().
+    @classmethod
+    def restore(cls, reader: SnapshotReader) -> "CompactParkingLot":
+        _, size, tree_size, cars, handles, words, free_spots = reader.header()
+        lot = cls.__new__(cls)
+        lot.snapshot_reader = reader
+        lot.__size = size
+        lot.__free_spots = free_spots
+        lot.spot_sizes = reader.take(size)
+        lot.spot_cars = reader.take(size * 4, "i")
+        lot.free_spot_tree = FreeSpotTree.__new__(FreeSpotTree)
+        lot.free_spot_tree.size = tree_size
+        lot.free_spot_tree.tree = reader.take(2 * tree_size, "b")
+        lot.car_sizes = bytearray(reader.take(cars))
+        lot.car_colors = reader.take_array("i", cars)
+        lot.car_brands = reader.take_array("i", cars)
+        lot.free_handles = reader.take_array("i", handles).tolist()
+        lot.words = bytes(reader.take(words)).decode().split("\0") if words else []
+        lot.word_ids = {word: i for i, word in enumerate(lot.words)}
+        return lot
+
 class UnboundedParkingLot(ParkingLot):
     def __init__(
         self,
@@ -138,69 +845,218 @@ class UnboundedParkingLot(ParkingLot):
             CarSize.MEDIUM: med_size,
             CarSize.LARGE: large_size,
         }
-        self.parking_spots = [ParkingInterval(0, length, None)]
-        self.__free_spots = self.parking_spots[0].get_max_slots(large_size)
+        self.parking_spots = IntervalTree()
+        self.gaps = GapTree()
+        # How many cars of each size the free intervals can still take.
+        self.__free_slots = {size: 0 for size in CarSize}
+        # Set by restore(): the mapped interval columns the trees are built
+        # from on first change, and the largest gap until then.
+        self.snapshot_reader: Optional[SnapshotReader] = None
+        self.columns: Optional[tuple] = None
+        self.mapped_largest_gap = 0
+        self.add_interval(ParkingInterval(0, length, None))
 
     def free_spots(self) -> int:
-        return self.__free_spots
+        return self.__free_slots[CarSize.LARGE]
 
-    def find_interval_index(self, index: int) -> int:
-        temp_interval = ParkingInterval(index, index, None)
-        return max(0, bisect_right(self.parking_spots, temp_interval) - 1)
+    def free_spots_for(self, size: CarSize) -> int:
+        return self.__free_slots[size]
+
+    def largest_gap(self) -> int:
+        if self.columns is not None:
+            return self.mapped_largest_gap
+        root = self.parking_spots.root
+        return max(root.max_gap, 0) if root else 0
+
+    # Builds the trees from the mapped columns of a restored lot, in O(n),
+    # and unmaps the snapshot. Does nothing once they exist.
+    def load_trees(self) -> None:
+        if self.columns is None:
+            return
+        starts, ends, sizes, colors, brands, words = self.columns
+        intervals = [
+            ParkingInterval(starts[i], ends[i], self.mapped_car(i))
+            for i in range(len(starts))
+        ]
+        self.parking_spots = IntervalTree.from_sorted(intervals)
+        self.gaps = GapTree.from_intervals(interval for interval in intervals if interval.car is None)
+        self.columns = None
+        self.close()
+
+    def mapped_car(self, i: int) -> Optional[Car]:
+        starts, ends, sizes, colors, brands, words = self.columns
+        if sizes[i] == -1:
+            return None
+        return Car(SIZE_STRING[CarSize(sizes[i])], words[colors[i]], words[brands[i]])
+
+    # Unmaps the snapshot of a restored lot whose trees were never built.
+    # The lot cannot be used afterwards.
+    def close(self) -> None:
+        if self.snapshot_reader is not None:
+            self.snapshot_reader.close()
+            self.snapshot_reader = None
+
+    def add_interval(self, interval: ParkingInterval) -> None:
+        self.parking_spots.insert(interval)
+        self.add_gap(interval)
+
+    def add_gap(self, interval: ParkingInterval) -> None:
+        if interval.car is None:
+            self.gaps.insert(interval)
+            for size, car_size in self.car_sizes.items():
+                self.__free_slots[size] += interval.get_max_slots(car_size)
+
+    def remove_gap(self, interval: ParkingInterval) -> None:
+        if interval.car is None:
+            self.gaps.remove(interval)
+            for size, car_size in self.car_sizes.items():
+                self.__free_slots[size] -= interval.get_max_slots(car_size)
 
     def park(self, index: int, car: Car) -> bool:
+        self.load_trees()
         car_size = self.car_sizes[car.size]
         car_interval = ParkingInterval(index, index + car_size, car)
-        index = self.find_interval_index(index)
-        for i in range(index, len(self.parking_spots)):
-            spot = self.parking_spots[i]
-            new_intervals = spot.park(car_interval)
-            if new_intervals:
-                self.__free_spots -= spot.get_max_slots(self.car_sizes[CarSize.LARGE])
-                for entry in new_intervals:
-                    if entry.car is None:
-                        self.__free_spots += entry.get_max_slots(self.car_sizes[CarSize.LARGE])
-                self.parking_spots[i : i + 1] = new_intervals
-                return True
-        return False
+        start = self.parking_spots.find(index)
+        spot = self.parking_spots.first_fit(start.start, car_size) if start else None
+        if spot is None:
+            return False
+        new_intervals = spot.park(car_interval)
+        self.remove_gap(spot)
+        # The first new interval always starts where spot did.
+        self.parking_spots.replace(new_intervals[0])
+        self.add_gap(new_intervals[0])
+        for entry in new_intervals[1:]:
+            self.add_interval(entry)
+        return True
+
+    # Park in the smallest free interval the car fits in.
+    def park_best_fit(self, car: Car) -> bool:
+        self.load_trees()
+        spot = self.gaps.ceiling(self.car_sizes[car.size])
+        if spot is None:
+            return False
+        return self.park(spot.start, car)
 
     def leave(self, index: int) -> None:
-        start_index = self.find_interval_index(index)
-        end_index = start_index + 1
-        if self.parking_spots[start_index].car is None:
+        self.load_trees()
+        spot = self.parking_spots.find(index)
+        if spot is None or spot.car is None:
             return
-        if (
-            end_index < len(self.parking_spots)
-            and self.parking_spots[end_index].car is None
-        ):
-            end_index += 1
-        if start_index > 0 and self.parking_spots[start_index - 1].car is None:
-            start_index -= 1
-        for i in range(start_index, end_index):
-            if self.parking_spots[i].car is None:
-                self.__free_spots -= self.parking_spots[i].get_max_slots(self.car_sizes[CarSize.LARGE])
-        new_interval = ParkingInterval(
-            self.parking_spots[start_index].start,
-            self.parking_spots[end_index - 1].end,
-            None,
-        )
-        self.parking_spots[start_index:end_index] = [new_interval]
-        self.__free_spots += new_interval.get_max_slots(self.car_sizes[CarSize.LARGE])
+        merged = [spot]
+        after = self.parking_spots.successor(spot)
+        if after is not None and after.car is None:
+            merged.append(after)
+        before = self.parking_spots.predecessor(spot)
+        if before is not None and before.car is None:
+            merged.insert(0, before)
+        for entry in merged:
+            self.remove_gap(entry)
+        for entry in merged[1:]:
+            self.parking_spots.remove(entry)
+        new_interval = ParkingInterval(merged[0].start, merged[-1].end, None)
+        self.parking_spots.replace(new_interval)
+        self.add_gap(new_interval)
 
     def get_spot(self, index: int) -> Optional[Car]:
-        interval_index = self.find_interval_index(index)
-        return self.parking_spots[interval_index].car
+        if self.columns is not None:
+            # Same interval IntervalTree.find picks, by binary search over
+            # the mapped starts.
+            return self.mapped_car(max(bisect_right(self.columns[0], index) - 1, 0))
+        spot = self.parking_spots.find(index)
+        return spot.car if spot else None
 
-def parking_system(lot_type: str, params: List[str], instructions: List[List[str]]) -> List[str]:
-    output_lines = []
-    parking_lot: ParkingLot
+    def snapshot(self, path: str) -> None:
+        self.load_trees()
+        words: Dict[str, int] = {}
+        starts, ends = array("q"), array("q")
+        sizes, colors, brands = array("b"), array("i"), array("i")
+        for interval in self.parking_spots:
+            starts.append(interval.start)
+            ends.append(interval.end)
+            car = interval.car
+            sizes.append(car.size.value if car else -1)
+            colors.append(words.setdefault(car.color, len(words)) if car else -1)
+            brands.append(words.setdefault(car.brand, len(words)) if car else -1)
+        vocabulary = "\0".join(words).encode()
+        with snapshot_file(path) as f:
+            f.write(SNAPSHOT_HEADER.pack(
+                SNAPSHOT_MAGIC,
+                UNBOUNDED_SNAPSHOT,
+                self.length,
+                self.car_sizes[CarSize.SMALL],
+                self.car_sizes[CarSize.MEDIUM],
+                self.car_sizes[CarSize.LARGE],
+                len(starts),
+                len(vocabulary),
+            ))
+            for column in (starts, ends, sizes, colors, brands):
+                write_padded(f, column.tobytes())
+            write_padded(f, vocabulary)
+            counters = [self.__free_slots[size] for size in CarSize] + [self.largest_gap()]
+            write_padded(f, array("q", counters).tobytes())
+
+    # The interval columns stay views over the mapped file: free counts and
+    # the largest gap come from stored counters and get_spot binary-searches
+    # the starts, paging in only what it touches. The trees are built in
+    # O(n) on the first change. The lot owns the reader until then.
+    @classmethod
+    def restore(cls, reader: SnapshotReader) -> "UnboundedParkingLot":
+        _, length, small, medium, large, count, vocabulary = reader.header()
+        starts = reader.take(count * 8, "q")
+        ends = reader.take(count * 8, "q")
+        sizes = reader.take(count, "b")
+        colors = reader.take(count * 4, "i")
+        brands = reader.take(count * 4, "i")
+        words = bytes(reader.take(vocabulary)).decode().split("\0") if vocabulary else []
+        counters = reader.take(4 * 8, "q")
+        lot = cls.__new__(cls)
+        lot.length = length
+        lot.car_sizes = {CarSize.SMALL: small, CarSize.MEDIUM: medium, CarSize.LARGE: large}
+        lot.parking_spots = IntervalTree()
+        lot.gaps = GapTree()
+        lot.__free_slots = {size: counters[size.value] for size in CarSize}
+        lot.mapped_largest_gap = counters[3]
+        lot.snapshot_reader = reader
+        lot.columns = (starts, ends, sizes, colors, brands, words)
+        return lot
+
+def restore_parking_lot(path: str) -> ParkingLot:
+    reader = SnapshotReader(path)
+    kind = reader.map[len(SNAPSHOT_MAGIC)]
+    if kind == SPOTS_SNAPSHOT:
+        return CompactParkingLot.restore(reader)
+    if kind == REGULAR_SNAPSHOT:
+        return RegularParkingLot.restore(reader)
+    if kind == UNBOUNDED_SNAPSHOT:
+        return UnboundedParkingLot.restore(reader)
+    raise ValueError(kind)
+
+def create_parking_lot(lot_type: str, params: List[str]) -> ParkingLot:
     if lot_type == "Regular":
-        parking_lot = RegularParkingLot(params)
+        return RegularParkingLot(params)
+    elif lot_type == "Compact":
+        return CompactParkingLot(params)
     elif lot_type == "Unbounded":
-        parking_lot = UnboundedParkingLot(*(int(val) for val in params))
-    else:
-        raise ValueError(lot_type)
+        return UnboundedParkingLot(*(int(val) for val in params))
+    raise ValueError(lot_type)
+
+def parking_system(lot_type: str, params: List[str], instructions: List[List[str]]) -> List[str]:
+    return list(iter_parking_system(lot_type, params, instructions))
+
+# Output goes to sink, such as a line_sink.LineSink, as it is produced;
+# returns the number of lines.
+def write_parking_system(lot_type: str, params: List[str], instructions: Iterable, sink) -> int:
+    return sink.write_lines(iter_parking_system(lot_type, params, instructions))
+
+# Lazy version of parking_system; string instructions are split on spaces,
+# so lines read from a file can be passed straight in.
+def iter_parking_system(lot_type: str, params: List[str], instructions: Iterable) -> Iterator[str]:
+    parking_lot = create_parking_lot(lot_type, params)
     for instruction in instructions:
+        if isinstance(instruction, str):
+            instruction = instruction.split()
+            if not instruction:
+                continue
         operation, *args = instruction
         if operation == "park":
             slot, *car_args = args
@@ -209,7 +1065,58 @@ def parking_system(lot_type: str, params: List[str], instructions: List[List[str
             parking_lot.leave(int(args[0]))
         elif operation == "print":
             car = parking_lot.get_spot(int(args[0]))
-            output_lines.append(str(car) if car else "Empty")
+            yield str(car) if car else "Empty"
         elif operation == "print_free_spots":
-            output_lines.append(str(parking_lot.free_spots()))
-    return output_lines
\ No newline at end of file
+            yield str(parking_lot.free_spots())
+
+class BillingEvent:
+    def __init__(self, kind: str, time: int, car: Car, duration: int) -> None:
+        self.kind = kind
+        self.time = time
+        self.car = car
+        self.size = car.size
+        self.duration = duration
+
+    def __str__(self) -> str:
+        return f"{self.kind} {self.time} {self.car} {self.duration}"
+
+# Timestamped variant of parking_system:
+#   ["park", time, slot, size, color, brand, expected_stay]
+#   ["remove", time, slot]
+#   ["tick", time]
+# It yields a "departure" event for every car that leaves and an "overstay"
+# event the first time the clock passes a parked car's expected departure.
+# Expected departures sit in a heap, so each check is O(log n) instead of a
+# scan of every occupied spot. Cars are matched by identity, so Compact lots,
+# which rebuild Car objects on every lookup, are not supported.
+def timed_parking_system(
+    lot_type: str,
+    params: List[str],
+    instructions: List[List[str]],
+) -> Iterator[BillingEvent]:
+    if lot_type == "Compact":
+        raise ValueError(lot_type)
+    parking_lot = create_parking_lot(lot_type, params)
+    parked_since: Dict[Car, int] = {}
+    departures: List[Tuple[int, int, Car]] = []
+    count = 0
+    for instruction in instructions:
+        operation, time, *args = instruction
+        now = int(time)
+        while departures and departures[0][0] < now:
+            expected, _, car = heapq.heappop(departures)
+            if car in parked_since:
+                yield BillingEvent("overstay", expected, car, expected - parked_since[car])
+        if operation == "park":
+            slot, size, color, brand, stay = args
+            car = Car(size, color, brand)
+            if parking_lot.park(int(slot), car):
+                parked_since[car] = now
+                count += 1
+                heapq.heappush(departures, (now + int(stay), count, car))
+        elif operation == "remove":
+            index = int(args[0])
+            car = parking_lot.get_spot(index)
+            parking_lot.leave(index)
+            if car in parked_since and parking_lot.get_spot(index) is not car:
+                yield BillingEvent("departure", now, car, now - parked_since.pop(car))
@@ -0,0 +1,106 @@
+# Multi-threaded stress test and throughput benchmark for ShardedParkingLot.
+# Gate threads park and remove cars at random spots. Afterwards every car a
+# thread saw parked must sit in exactly one spot, and the lot's free count
+# must match the empty spots. The same workload also runs against a single
+# RegularParkingLot behind one global lock for comparison.
+#
+# First, single-threaded, ShardedParkingLot must place cars exactly like
+# RegularParkingLot, negative indices included, and with wrap=True must
+# place a car whenever any spot that fits is free.
+#
+#     python stress_sharded.py [spots] [operations per thread]
+import random
+import sys
+import threading
+import time
+from threading import Lock
+
+from parking_lot_free import Car, ParkingLot, RegularParkingLot, ShardedParkingLot
+
+SIZES = ["Small", "Medium", "Large"]
+
+class LockedParkingLot(ParkingLot):
+    def __init__(self, spots):
+        self.lot = RegularParkingLot(spots)
+        self.lock = Lock()
+
+    def free_spots(self):
+        return self.lot.free_spots()
+
+    def park(self, index, car):
+        with self.lock:
+            return self.lot.park(index, car)
+
+    def leave(self, index):
+        with self.lock:
+            self.lot.leave(index)
+
+    def get_spot(self, index):
+        with self.lock:
+            return self.lot.get_spot(index)
+
+def check_against_regular(cases=300):
+    rng = random.Random(1)
+    for _ in range(cases):
+        spots = [rng.choice(SIZES) for _ in range(rng.randint(1, 60))]
+        zones = rng.randint(1, 20)
+        regular, sharded = RegularParkingLot(spots), ShardedParkingLot(spots, zones)
+        wrapping = ShardedParkingLot(spots, zones, wrap=True)
+        for n in range(200):
+            index = rng.randrange(-len(spots), len(spots) + 2)
+            if rng.random() < 0.6:
+                car = Car(rng.choice(SIZES), "white", str(n))
+                assert regular.park(index, car) == sharded.park(index, car)
+                fits = any(
+                    wrapping.get_spot(i) is None and SIZES.index(spots[i]) >= car.size.value
+                    for i in range(len(spots))
+                )
+                assert wrapping.park(index, car) == fits
+            elif index < len(spots):
+                regular.leave(index)
+                sharded.leave(index)
+                wrapping.leave(index)
+            assert regular.free_spots() == sharded.free_spots()
+        assert [regular.get_spot(i) for i in range(-len(spots), len(spots))] == [sharded.get_spot(i) for i in range(-len(spots), len(spots))]
+
+def run(lot, spot_count, threads, operations):
+    parked = [0] * threads
+
+    def gate(k):
+        rng = random.Random(k)
+        for n in range(operations):
+            index = rng.randrange(spot_count)
+            # Mostly arrivals, so zones fill up and arrivals spill over.
+            if rng.random() < 0.7:
+                parked[k] += lot.park(index, Car(rng.choice(SIZES), f"gate-{k}", str(n)))
+            else:
+                lot.leave(index)
+
+    gates = [threading.Thread(target=gate, args=(k,)) for k in range(threads)]
+    start = time.perf_counter()
+    for thread in gates:
+        thread.start()
+    for thread in gates:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    cars = [lot.get_spot(i) for i in range(spot_count)]
+    occupied = [car for car in cars if car is not None]
+    assert len({id(car) for car in occupied}) == len(occupied), "a car is in two spots"
+    assert lot.free_spots() == spot_count - len(occupied), "free count drifted"
+    assert len(occupied) <= sum(parked)
+    return threads * operations / elapsed
+
+def main():
+    check_against_regular()
+    spot_count = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    operations = int(sys.argv[2]) if len(sys.argv) > 2 else 20_000
+    rng = random.Random(0)
+    spots = [rng.choice(SIZES) for _ in range(spot_count)]
+    for threads in (1, 2, 4, 8):
+        sharded = run(ShardedParkingLot(spots), spot_count, threads, operations)
+        locked = run(LockedParkingLot(spots), spot_count, threads, operations)
+        print(f"{threads} threads: sharded {sharded:,.0f} ops/s, one lock {locked:,.0f} ops/s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+# Multi-tag lookups and counts on the bitset tag matrix against the
+# original per-book scan, all(tag in book.tags ...) through lookup_book.
+# Books get three random tags from the vocabulary; every other book also
+# gets "even" so some queries match many books.
+#
+#     python bench_tags.py [books] [tags]
+import random
+import sys
+import time
+
+from main import Library, TraditionalBook
+
+def build(books, tags):
+    rng = random.Random(0)
+    library = Library()
+    for i in range(books):
+        book = TraditionalBook(f"title-{i % 50_000}", f"author-{i % 20_000}")
+        book.id = str(i)
+        library.register_book(book)
+        for _ in range(3):
+            library.tag_book(book, f"tag-{rng.randrange(tags)}")
+        if i % 2 == 0:
+            library.tag_book(book, "even")
+    return library
+
+def timed(function, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+def main():
+    books = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    tags = int(sys.argv[2]) if len(sys.argv) > 2 else 10_000
+    start = time.perf_counter()
+    library = build(books, tags)
+    matrix = sum(map(len, library.tag_matrix.columns.values()))
+    print(f"built {books} books x {tags} tags in {time.perf_counter() - start:.0f}s, bitsets {matrix / 2 ** 20:,.0f} MiB")
+    for query in (["even", "tag-1"], ["tag-1", "tag-2"], ["even"]):
+        scan_ms, scanned = timed(lambda: library.lookup_book(lambda book: all(tag in book.tags for tag in query)), 1)
+        # The first query converts its columns to ints; later ones reuse them.
+        cold_ms, _ = timed(lambda: library.count_tags(query), 1)
+        lookup_ms, found = timed(lambda: library.lookup_tags(query), 10)
+        count_ms, count = timed(lambda: library.count_tags(query), 10)
+        assert [book.id for book in scanned] == [book.id for book in found] and count == len(found)
+        print(
+            f"{' '.join(query)}: {count} books, scan {scan_ms:.1f}ms, "
+            f"lookup_tags {lookup_ms:.2f}ms, count_tags {cold_ms:.2f}ms cold / {count_ms:.2f}ms warm"
+        )
+    cached = sum((mask.bit_length() + 7) // 8 for mask in library.tag_matrix.masks.values())
+    print(f"column ints kept for queried tags: {cached / 2 ** 20:.1f} MiB")
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 import re
-from typing import List
+from typing import Iterable, Iterator, List
 
 class Book:
     DISALLOWED_TAGS = {"traditional-book", "magazine"}
@@ -7,6 +7,8 @@ class Book:
     def __init__(self, title):
         self.title = title
         self.id = None
+        # Row in the library's tag matrix, set on registration.
+        self.row = None
         self.borrowed_by = None
         self.tags = set()
 
@@ -47,11 +49,107 @@ class Magazine(Book):
     def __str__(self):
         return f'"{self.title}" Issue {self.issue_number}'
 
+NONZERO_BYTE = re.compile(b"[^\x00]")
+ZERO_BLOCK = bytes(256)
+# Positions of the set bits in each byte value.
+BYTE_BITS = [tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256)]
+
+# Books x tags as one packed bitset per interned tag, bit i standing for
+# the book in row i. Columns are bytearrays that grow as rows get tagged;
+# queries turn them into ints so AND and popcount run over the whole
+# catalog at once. The int form of a column is kept until the column
+# changes, and each tag's popcount is kept as rows get tagged.
+class TagMatrix:
+    def __init__(self):
+        self.columns = {}
+        self.counts = {}
+        self.masks = {}
+        self.rows = 0
+
+    def add_row(self):
+        self.rows += 1
+        return self.rows - 1
+
+    def set(self, row, tag):
+        column = self.columns.get(tag)
+        if column is None:
+            column = self.columns[tag] = bytearray()
+        index = row >> 3
+        if index >= len(column):
+            column.extend(bytes(max(index + 1 - len(column), len(column))))
+        bit = 1 << (row & 7)
+        if not column[index] & bit:
+            column[index] |= bit
+            self.counts[tag] = self.counts.get(tag, 0) + 1
+            self.masks.pop(tag, None)
+
+    def column_mask(self, tag):
+        mask = self.masks.get(tag)
+        if mask is None:
+            mask = self.masks[tag] = int.from_bytes(self.columns[tag], "little")
+        return mask
+
+    # Rows carrying every tag, as an int bitmask. Tags carried by the fewest
+    # books go first, so a rare tag zeroes the mask early.
+    def mask(self, tags):
+        tags = set(tags)
+        if not tags or not tags <= self.columns.keys():
+            return 0
+        mask = -1
+        for tag in sorted(tags, key=self.counts.__getitem__):
+            mask &= self.column_mask(tag)
+            if not mask:
+                return 0
+        return mask
+
+    def count(self, tags):
+        return self.mask(tags).bit_count()
+
+    # Set bits of a mask in ascending order. All-zero blocks are skipped
+    # with a memcmp before the byte scan, which keeps sparse results cheap.
+    @staticmethod
+    def rows_of(mask):
+        data = mask.to_bytes((mask.bit_length() + 7) >> 3, "little")
+        for start in range(0, len(data), len(ZERO_BLOCK)):
+            if data.startswith(ZERO_BLOCK, start):
+                continue
+            for match in NONZERO_BYTE.finditer(data, start, start + len(ZERO_BLOCK)):
+                base = match.start() << 3
+                for bit in BYTE_BITS[data[match.start()]]:
+                    yield base | bit
+
+# A user's suggestion score per book id, bucketed by score. Scores only go
+# up (tags and favorites are never removed), so the top bucket is a running
+# max and needs no rescan.
+class SuggestionScores:
+    def __init__(self):
+        self.scores = {}
+        self.buckets = {}
+        self.max_score = 0
+
+    def bump(self, id):
+        score = self.scores.get(id, 0)
+        if score:
+            bucket = self.buckets[score]
+            bucket.remove(id)
+            if not bucket:
+                del self.buckets[score]
+        score += 1
+        self.scores[id] = score
+        self.buckets.setdefault(score, set()).add(id)
+        if score > self.max_score:
+            self.max_score = score
+
+    def top(self):
+        return self.buckets.get(self.max_score, ())
+
 class User:
     def __init__(self, name):
         self.name = name
         self.borrowed_book = None
         self.favorite_tags = set()
+        # Maintained by Library.favorite, tag_book and register_book.
+        self.suggestions = SuggestionScores()
 
     def __str__(self):
         return self.name
@@ -72,12 +170,10 @@ class User:
     def add_favorite_tag(self, tag):
         self.favorite_tags.add(tag)
 
+    # How many of the user's favorite tags book carries, read from the
+    # incremental scores the library keeps for its registered books.
     def get_suggestion_score(self, book):
-        count = 0
-        for tag in book.tags:
-            if tag in self.favorite_tags:
-                count += 1
-        return count
+        return self.suggestions.scores.get(book.id, 0)
 
     def get_max_suggestion_score(self, books):
         return max((self.get_suggestion_score(book) for book in books), default=0)
@@ -86,10 +182,50 @@ class Library:
     def __init__(self):
         self.books = {}
         self.users = {}
+        # Secondary indexes kept up to date by register_book and tag_book.
+        # Title and author map to dicts used as ordered sets of ids, so
+        # matches come back in registration order; tags live in a bitset
+        # matrix over book rows.
+        self.ids_by_title = {}
+        self.ids_by_author = {}
+        self.tag_matrix = TagMatrix()
+        self.book_rows = []
+        self.users_by_tag = {}
 
     def register_book(self, book):
         if book.id not in self.books:
             self.books[book.id] = book
+            self.ids_by_title.setdefault(book.title, {})[book.id] = None
+            if isinstance(book, TraditionalBook):
+                self.ids_by_author.setdefault(book.author, {})[book.id] = None
+            book.row = self.tag_matrix.add_row()
+            self.book_rows.append(book)
+            for tag in book.tags:
+                self.tag_matrix.set(book.row, tag)
+                for user in self.users_by_tag.get(tag, ()):
+                    user.suggestions.bump(book.id)
+
+    def tag_book(self, book, tag):
+        if tag in book.tags:
+            return
+        book.add_tag(tag)
+        if tag in book.tags:
+            self.tag_matrix.set(book.row, tag)
+            for user in self.users_by_tag.get(tag, ()):
+                user.suggestions.bump(book.id)
+
+    def favorite(self, user, tag):
+        if tag in user.favorite_tags:
+            return
+        user.add_favorite_tag(tag)
+        self.users_by_tag.setdefault(tag, set()).add(user)
+        for row in TagMatrix.rows_of(self.tag_matrix.mask((tag,))):
+            user.suggestions.bump(self.book_rows[row].id)
+
+    # Books with the user's highest positive suggestion score, in no
+    # particular order.
+    def suggest(self, user):
+        return [self.books[id] for id in user.suggestions.top()]
 
     def find_user(self, username):
         if username not in self.users:
@@ -103,6 +239,24 @@ class Library:
                 result.append(book)
         return result
 
+    def lookup_id(self, id):
+        book = self.books.get(id)
+        return [] if book is None else [book]
+
+    def lookup_title(self, title):
+        return [self.books[id] for id in self.ids_by_title.get(title, ())]
+
+    def lookup_author(self, author):
+        return [self.books[id] for id in self.ids_by_author.get(author, ())]
+
+    # Books carrying every tag, in registration order.
+    def lookup_tags(self, tags):
+        mask = self.tag_matrix.mask(tags)
+        return [self.book_rows[row] for row in TagMatrix.rows_of(mask)]
+
+    def count_tags(self, tags):
+        return self.tag_matrix.count(tags)
+
 def output_book(
     book_list,
     output,
@@ -127,10 +281,23 @@ def output_book(
         output.append(f"{available_count} book(s) available")
 
 def simulate_library(instructions: List[str]) -> List[str]:
+    return list(iter_library(instructions))
+
+# Streaming counterpart writing to a line_sink.LineSink or anything else
+# with write_lines; returns the number of lines.
+def write_library(instructions: Iterable[str], sink) -> int:
+    return sink.write_lines(iter_library(instructions))
+
+# Yields output lines as each instruction is processed, so lines read from
+# a file can be replayed without holding the whole output.
+def iter_library(instructions: Iterable[str]) -> Iterator[str]:
     library = Library()
     output: List[str] = []
 
     for instruction in instructions:
+        instruction = instruction.rstrip("\r\n")
+        if not instruction:
+            continue
         command, sub_instruction = instruction.split(" ", 1)
         if command == "register":
             subcommand, id, rest = sub_instruction.split(" ", 2)
@@ -145,40 +312,30 @@ def simulate_library(instructions: List[str]) -> List[str]:
         elif command == "lookup":
             subcommand, rest = sub_instruction.split(" ", 1)
             if subcommand == "id":
-                book_list = library.lookup_book(lambda book: book.id == rest)
-                output_book(book_list, output)
+                output_book(library.lookup_id(rest), output)
             elif subcommand == "title":
-                book_list = library.lookup_book(lambda book: book.title == rest)
+                book_list = library.lookup_title(rest)
                 output_book(
                     book_list,
                     output,
                     lambda book_list: f"{len(book_list)} books match the title: {rest}",
                 )
             elif subcommand == "author":
-                book_list = library.lookup_book(
-                    lambda book: isinstance(book, TraditionalBook) and book.author == rest
-                )
+                book_list = library.lookup_author(rest)
                 output_book(
                     book_list,
                     output,
                     lambda book_list: f"{len(book_list)} books match the author: {rest}",
                 )
             elif subcommand == "tags":
-                tags = rest.split(" ")
-                book_list = library.lookup_book(
-                    lambda book: all(tag in book.tags for tag in tags)
-                )
+                book_list = library.lookup_tags(rest.split(" "))
                 output_book(
                     book_list,
                     output,
                     lambda book_list: f"{len(book_list)} books match the tag(s): {rest}",
                 )
             elif subcommand == "suggestion":
-                user = library.find_user(rest)
-                max_score = user.get_max_suggestion_score(library.books.values())
-                book_list = library.lookup_book(
-                    lambda book: user.get_suggestion_score(book) > 0 and user.get_suggestion_score(book) == max_score
-                )
+                book_list = library.suggest(library.find_user(rest))
                 output_book(
                     book_list,
                     output,
@@ -194,8 +351,9 @@ def simulate_library(instructions: List[str]) -> List[str]:
             id, *tags = sub_instruction.split(" ")
             if id in library.books:
                 for tag in tags:
-                    library.books[id].add_tag(tag)
+                    library.tag_book(library.books[id], tag)
         elif command == "favorite":
             tag, name = sub_instruction.split(" ", 1)
-            library.find_user(name).add_favorite_tag(tag)
-    return output
+            library.favorite(library.find_user(name), tag)
+        yield from output
+        output.clear()
@@ -0,0 +1,65 @@
+# Stress test and throughput of ConcurrentMachine. Each thread runs its own
+# session buying either from its own product or from one product shared by
+# every thread, paying from a limited coin stock. Products hold half as many
+# units as are asked for, so they sell out mid-run and checkout then refunds
+# the coins just inserted. Afterwards the stock, sales totals and coin
+# counts are checked against what the threads saw.
+#
+#     python bench_concurrent.py [purchases per thread]
+import sys
+import threading
+import time
+
+from main import Coin, ConcurrentMachine, Machine
+
+PRICE = 35
+
+def run(threads, purchases, shared):
+    machine = Machine(coin_stock={coin: 1000 for coin in Coin})
+    kiosk = ConcurrentMachine(machine)
+    names = ["shared"] if shared else [f"product-{k}" for k in range(threads)]
+    for name in names:
+        kiosk.new_product(name, PRICE)
+        kiosk.restock(name, purchases // 2 * (threads if shared else 1))
+    bought = [0] * threads
+    paid_out = [0] * threads
+
+    def worker(k):
+        name = names[0] if shared else names[k]
+        session = f"session-{k}"
+        for _ in range(purchases):
+            kiosk.insert_coin(session, Coin.quarter)
+            kiosk.insert_coin(session, Coin.dime)
+            bought[k] += kiosk.purchase(session, name)
+            paid_out[k] += sum(n * coin.value for n, coin in kiosk.checkout(session))
+
+    workers = [threading.Thread(target=worker, args=(k,)) for k in range(threads)]
+    start = time.perf_counter()
+    for worker_thread in workers:
+        worker_thread.start()
+    for worker_thread in workers:
+        worker_thread.join()
+    elapsed = time.perf_counter() - start
+
+    sold = sum(bought)
+    assert sold == purchases // 2 * threads
+    assert all(machine.products[name].quantity == 0 for name in names)
+    totals = kiosk.totals()
+    assert totals.sales == sold and totals.revenue == sold * PRICE
+    coins_in = sum(n * coin.value for coin, n in totals.coins_in.items())
+    coins_out = sum(n * coin.value for coin, n in totals.coins_out.items())
+    assert coins_out == sum(paid_out)
+    left_in_sessions = sum(session.balance for session in kiosk.sessions.values())
+    assert coins_in == totals.revenue + coins_out + left_in_sessions
+    assert all(count >= 0 for count in machine.coin_stock.values())
+    return threads * purchases / elapsed
+
+def main():
+    purchases = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000
+    for threads in (1, 2, 4, 8):
+        own = run(threads, purchases, shared=False)
+        shared = run(threads, purchases, shared=True)
+        print(f"{threads} threads: {own:,.0f} purchases/s on own products, {shared:,.0f} on one shared product")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+# Price-ordered listings on a 100k-product catalog: the original
+# print_products, which sorts every product on each call (kept below),
+# against the incrementally maintained price index. Both replay the same
+# mixed stream of new products, price changes, restocks, purchases and
+# listings, and must print the same lines.
+#
+#     python bench_price_index.py [products] [instructions]
+import random
+import sys
+import time
+import zlib
+from typing import List
+
+from main import Machine, iter_vending_machine
+
+class SortingMachine(Machine):
+    # Original implementation, unchanged.
+    def print_products(self) -> List[str]:
+        products = sorted(self.products.values(), key=lambda p: p.price)
+        return [str(p) for p in products]
+
+def instructions(products, count):
+    rng = random.Random(0)
+    stream = [["new_product", f"p{i}", str(rng.randint(1, 500))] for i in range(products)]
+    for n in range(count):
+        name = f"p{rng.randrange(products)}"
+        r = rng.random()
+        if r < 0.4:
+            stream.append(["restock", name, str(rng.randint(1, 5))])
+        elif r < 0.6:
+            stream.append(["insert_coin", "quarter"])
+        elif r < 0.8:
+            stream.append(["purchase", name])
+        elif r < 0.99:
+            # Re-adding a product moves it in the price order.
+            stream.append(["new_product", name, str(rng.randint(1, 500))])
+        else:
+            stream.append(["print_products"])
+    return stream
+
+def run(machine, stream):
+    checksum = 0
+    start = time.perf_counter()
+    for line in iter_vending_machine(stream, machine):
+        checksum = zlib.crc32(line.encode(), checksum)
+    return time.perf_counter() - start, checksum
+
+def main():
+    products = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 5_000
+    stream = instructions(products, count)
+    listings = sum(1 for instruction in stream if instruction[0] == "print_products")
+    checksums = set()
+    for machine in (SortingMachine(), Machine()):
+        elapsed, checksum = run(machine, stream)
+        checksums.add(checksum)
+        print(f"{type(machine).__name__}: {elapsed:.2f}s for {len(stream)} instructions with {listings} listings")
+    assert len(checksums) == 1, "listings differ"
+    start = time.perf_counter()
+    for _ in range(10_000):
+        machine.cheapest(10)
+    print(f"cheapest(10): {(time.perf_counter() - start) / 10_000 * 1e6:.1f}us per call")
+
+if __name__ == "__main__":
+    main()
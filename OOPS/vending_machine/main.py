@@ -1,5 +1,12 @@
+import asyncio
+import os
+from bisect import bisect_left, insort
+from collections import deque
 from enum import Enum
-from typing import Dict, List, Tuple
+from itertools import islice
+from multiprocessing import Pool
+from threading import Lock
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
 class Coin(Enum):
     penny = 1
@@ -16,64 +23,384 @@ class Product:
     def __str__(self) -> str:
         return f"{self.name} {self.price} {self.quantity}"
 
+# Bounded-inventory change making: the fewest coins summing to an amount
+# without dispensing more of any coin than is in stock. used[k][a] is how many
+# of coins[k] the best way to pay a with coins[0..k] takes, so one table
+# answers every amount up to its limit. More than limit // value of a coin
+# can never be used, so the table only depends on the stock clamped to that
+# and stays valid while the clamped stock (its key) is unchanged.
+class ChangeMaker:
+    def __init__(self, coins: List[Coin], stock: Dict[Coin, int], limit: int) -> None:
+        self.coins = coins
+        self.limit = limit
+        self.key = self.clamp(stock)
+        unreachable = limit + 1
+        best = [0] + [unreachable] * limit
+        self.used: List[List[int]] = []
+        for coin in coins:
+            value, count = coin.value, stock[coin]
+            nxt = [unreachable] * (limit + 1)
+            used = [0] * (limit + 1)
+            # For a = r + q * value, taking j = q - m coins costs
+            # best[r + m * value] - m + q, so a sliding window minimum over
+            # m in [q - count, q] covers every residue class in O(limit).
+            for r in range(min(value, limit + 1)):
+                window: deque = deque()
+                for q, a in enumerate(range(r, limit + 1, value)):
+                    cost = best[a] - q
+                    while window and window[-1][1] >= cost:
+                        window.pop()
+                    window.append((q, cost))
+                    if window[0][0] < q - count:
+                        window.popleft()
+                    m, cost = window[0]
+                    if cost + q < unreachable:
+                        nxt[a] = cost + q
+                        used[a] = q - m
+            best = nxt
+            self.used.append(used)
+        self.best = best
+
+    def clamp(self, stock: Dict[Coin, int]) -> Tuple[int, ...]:
+        return tuple(min(stock[coin], self.limit // coin.value) for coin in self.coins)
+
+    def serves(self, stock: Dict[Coin, int], amount: int) -> bool:
+        return amount <= self.limit and self.key == self.clamp(stock)
+
+    def solve(self, amount: int) -> Optional[List[Tuple[int, Coin]]]:
+        if self.best[amount] > self.limit:
+            return None
+        out: List[Tuple[int, Coin]] = []
+        for k in reversed(range(len(self.coins))):
+            n = self.used[k][amount]
+            if n:
+                out.append((n, self.coins[k]))
+                amount -= n * self.coins[k].value
+        out.reverse()
+        return out
+
+def greedy_change(coins: List[Coin], balance: int) -> List[Tuple[int, Coin]]:
+    out: List[Tuple[int, Coin]] = []
+    for coin in coins:
+        n, balance = divmod(balance, coin.value)
+        if n:
+            out.append((n, coin))
+    return out
+
+class SalesTotals:
+    def __init__(self, machines: int = 0) -> None:
+        self.machines = machines
+        self.sales = 0
+        self.revenue = 0
+        self.coins_in = {coin: 0 for coin in Coin}
+        self.coins_out = {coin: 0 for coin in Coin}
+
+    def add(self, other: "SalesTotals") -> None:
+        self.machines += other.machines
+        self.sales += other.sales
+        self.revenue += other.revenue
+        for coin in Coin:
+            self.coins_in[coin] += other.coins_in[coin]
+            self.coins_out[coin] += other.coins_out[coin]
+
 class Machine:
-    def __init__(self) -> None:
+    # Without a coin_stock the machine pays change from an unlimited supply.
+    # Change tables cover amounts up to change_limit (or the balance, if
+    # larger), so one table serves checkout after checkout.
+    def __init__(self, coin_stock: Optional[Dict[Coin, int]] = None, change_limit: int = 1000) -> None:
         self.products: Dict[str, Product] = {}
         self.balance = 0
         self.coins = sorted(Coin, key=lambda coin: coin.value, reverse=True)
+        self.coin_stock = None if coin_stock is None else {coin: coin_stock.get(coin, 0) for coin in Coin}
+        self.change_limit = change_limit
+        self.change_maker: Optional[ChangeMaker] = None
+        self.totals = SalesTotals(machines=1)
+        # (price, first-seen order, name), kept sorted so listings never re-sort.
+        # The order breaks ties the way a stable sort over self.products did.
+        self.price_index: List[Tuple[int, int, str]] = []
+        self.order: Dict[str, int] = {}
 
     def new_product(self, name: str, price: int) -> None:
+        if name in self.products:
+            self.unindex(name)
+        else:
+            self.order[name] = len(self.order)
         product = Product(name, price)
         self.products[name] = product
+        insort(self.price_index, (price, self.order[name], name))
+
+    def set_price(self, name: str, price: int) -> None:
+        self.unindex(name)
+        self.products[name].price = price
+        insort(self.price_index, (price, self.order[name], name))
+
+    def unindex(self, name: str) -> None:
+        entry = (self.products[name].price, self.order[name], name)
+        del self.price_index[bisect_left(self.price_index, entry)]
 
     def print_products(self) -> List[str]:
-        products = sorted(self.products.values(), key=lambda p: p.price)
-        return [str(p) for p in products]
+        return [str(self.products[name]) for _, _, name in self.price_index]
+
+    def cheapest(self, k: int) -> List[Product]:
+        return [self.products[name] for _, _, name in islice(self.price_index, k)]
 
     def restock(self, name: str, quantity: int) -> None:
         self.products[name].quantity += quantity
 
     def insert_coin(self, coin: Coin) -> None:
         self.balance += coin.value
+        self.totals.coins_in[coin] += 1
+        if self.coin_stock is not None:
+            self.load_coins(coin, 1)
+
+    def load_coins(self, coin: Coin, count: int) -> None:
+        self.coin_stock[coin] += count
+
+    # The memoised change table if it is still valid for amount, else None.
+    def change_maker_for(self, amount: int) -> Optional[ChangeMaker]:
+        maker = self.change_maker
+        if maker is not None and maker.serves(self.coin_stock, amount):
+            return maker
+        return None
 
     def purchase(self, name: str) -> bool:
         product = self.products[name]
         if product.price <= self.balance and product.quantity >= 1:
             self.balance -= product.price
             product.quantity -= 1
+            self.totals.sales += 1
+            self.totals.revenue += product.price
             return True
         return False
 
+    # Pays the balance. If the coin stock cannot make exact change nothing
+    # is dispensed and the balance is kept.
     def checkout(self) -> List[Tuple[int, Coin]]:
-        balance = self.balance
+        out = self.dispense(self.balance)
+        if out is None:
+            return []
         self.balance = 0
-        out: List[Tuple[int, Coin]] = []
-        for coin in self.coins:
-            n, balance = divmod(balance, coin.value)
-            if n:
-                out.append((n, coin))
         return out
 
-def vending_machine(instructions: List[List[str]]) -> List[str]:
-    output_lines = []
-    machine = Machine()
+    # Coins for amount, with the fewest coins the stock allows and taken out
+    # of it, or None if exact change is impossible. Without a stock the
+    # supply is unlimited.
+    def dispense(self, amount: int) -> Optional[List[Tuple[int, Coin]]]:
+        if self.coin_stock is None:
+            out = greedy_change(self.coins, amount)
+        else:
+            maker = self.change_maker_for(amount)
+            if maker is None:
+                maker = ChangeMaker(self.coins, self.coin_stock, max(amount, self.change_limit))
+                self.change_maker = maker
+            out = maker.solve(amount)
+            if out is None:
+                return None
+            for n, coin in out:
+                self.load_coins(coin, -n)
+        for n, coin in out:
+            self.totals.coins_out[coin] += n
+        return out
+
+class Session:
+    def __init__(self) -> None:
+        self.balance = 0
+        self.coins_in = {coin: 0 for coin in Coin}
+        self.lock = Lock()
+
+# Front end for a kiosk serving several sessions at once. Each session keeps
+# its own balance and coin count, and each product has its own lock guarding
+# its stock and its sales, so purchases of different products never wait on
+# each other. cash_lock guards only the wrapped machine's coin stock and
+# coins paid out; change tables are built outside it. Catalog changes go
+# through catalog_lock. Locks are always taken session, catalog, product,
+# cash. totals() adds everything up when asked.
+class ConcurrentMachine:
+    def __init__(self, machine: Machine) -> None:
+        self.machine = machine
+        self.sessions: Dict[str, Session] = {}
+        self.product_locks: Dict[str, Lock] = {}
+        self.product_sales: Dict[str, SalesTotals] = {}
+        self.catalog_lock = Lock()
+        self.cash_lock = Lock()
+
+    def session(self, session_id: str) -> Session:
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = self.sessions.setdefault(session_id, Session())
+        return session
+
+    def product_lock(self, name: str) -> Lock:
+        lock = self.product_locks.get(name)
+        if lock is None:
+            lock = self.product_locks.setdefault(name, Lock())
+        return lock
+
+    # Sales of one product; only touched under that product's lock.
+    def sales(self, name: str) -> SalesTotals:
+        sales = self.product_sales.get(name)
+        if sales is None:
+            sales = self.product_sales.setdefault(name, SalesTotals())
+        return sales
+
+    def new_product(self, name: str, price: int) -> None:
+        with self.catalog_lock, self.product_lock(name):
+            self.machine.new_product(name, price)
+
+    def set_price(self, name: str, price: int) -> None:
+        with self.catalog_lock, self.product_lock(name):
+            self.machine.set_price(name, price)
+
+    def restock(self, name: str, quantity: int) -> None:
+        with self.product_lock(name):
+            self.machine.restock(name, quantity)
+
+    def insert_coin(self, session_id: str, coin: Coin) -> None:
+        session = self.session(session_id)
+        with session.lock:
+            session.balance += coin.value
+            session.coins_in[coin] += 1
+            if self.machine.coin_stock is not None:
+                with self.cash_lock:
+                    self.machine.load_coins(coin, 1)
+
+    def purchase(self, session_id: str, name: str) -> bool:
+        session = self.session(session_id)
+        with session.lock:
+            with self.product_lock(name):
+                product = self.machine.products[name]
+                if product.price > session.balance or product.quantity < 1:
+                    return False
+                product.quantity -= 1
+                sales = self.sales(name)
+                sales.sales += 1
+                sales.revenue += product.price
+            session.balance -= product.price
+            return True
+
+    # Pays the session's balance from the machine's coin stock; like
+    # Machine.checkout, nothing is dispensed if exact change is impossible.
+    # A stale change table is rebuilt from a copy of the stock with
+    # cash_lock released, so one rebuild never stalls other checkouts.
+    def checkout(self, session_id: str) -> List[Tuple[int, Coin]]:
+        session = self.session(session_id)
+        with session.lock:
+            amount = session.balance
+            machine = self.machine
+            with self.cash_lock:
+                ready = machine.coin_stock is None or machine.change_maker_for(amount) is not None
+                if ready:
+                    out = machine.dispense(amount)
+                else:
+                    stock = dict(machine.coin_stock)
+            if not ready:
+                maker = ChangeMaker(machine.coins, stock, max(amount, machine.change_limit))
+                with self.cash_lock:
+                    if maker.serves(machine.coin_stock, amount):
+                        machine.change_maker = maker
+                    out = machine.dispense(amount)
+            if out is None:
+                return []
+            session.balance = 0
+            return out
+
+    # The wrapped machine's totals plus every session's coins and every
+    # product's sales. Each part is read under its own lock, so the result
+    # is exact once the kiosk is idle.
+    def totals(self) -> SalesTotals:
+        totals = SalesTotals()
+        with self.cash_lock:
+            totals.add(self.machine.totals)
+        for session in list(self.sessions.values()):
+            with session.lock:
+                for coin, count in session.coins_in.items():
+                    totals.coins_in[coin] += count
+        for name, sales in list(self.product_sales.items()):
+            with self.product_lock(name):
+                totals.add(sales)
+        return totals
+
+    # Coroutine entry points for asyncio servers; the blocking part runs on
+    # a worker thread so the event loop never waits on a lock.
+    async def insert_coin_async(self, session_id: str, coin: Coin) -> None:
+        await asyncio.to_thread(self.insert_coin, session_id, coin)
+
+    async def purchase_async(self, session_id: str, name: str) -> bool:
+        return await asyncio.to_thread(self.purchase, session_id, name)
+
+    async def checkout_async(self, session_id: str) -> List[Tuple[int, Coin]]:
+        return await asyncio.to_thread(self.checkout, session_id)
+
+def vending_machine(instructions: List[List[str]], machine: Optional[Machine] = None) -> List[str]:
+    return list(iter_vending_machine(instructions, machine))
+
+# Writes the output to sink, e.g. a line_sink.LineSink, instead of
+# collecting it; returns the line count.
+def write_vending_machine(instructions: Iterable, sink, machine: Optional[Machine] = None) -> int:
+    return sink.write_lines(iter_vending_machine(instructions, machine))
+
+# Yields output lines as each instruction is processed. Instructions may be
+# lists or whitespace-separated strings, so a file can be passed directly.
+def iter_vending_machine(instructions: Iterable, machine: Optional[Machine] = None) -> Iterator[str]:
+    if machine is None:
+        machine = Machine()
     for instruction in instructions:
+        if isinstance(instruction, str):
+            instruction = instruction.split()
+            if not instruction:
+                continue
         if instruction[0] == "new_product":
             machine.new_product(instruction[1], int(instruction[2]))
         elif instruction[0] == "print_products":
-            output_lines += machine.print_products()
+            yield from machine.print_products()
         elif instruction[0] == "restock":
             machine.restock(instruction[1], int(instruction[2]))
         elif instruction[0] == "insert_coin":
             name = instruction[1]
             if name in Coin.__members__:
                 machine.insert_coin(Coin[name])
-                output_lines.append("accepted")
+                yield "accepted"
             else:
-                output_lines.append("rejected")
+                yield "rejected"
         elif instruction[0] == "purchase":
-            output_lines.append("true" if machine.purchase(instruction[1]) else "false")
+            yield "true" if machine.purchase(instruction[1]) else "false"
         elif instruction[0] == "checkout":
             for n, coin in machine.checkout():
-                output_lines.append(f"{n} {coin.name}")
-    return output_lines
\ No newline at end of file
+                yield f"{n} {coin.name}"
+
+def replay_machine(instructions: List[List[str]]) -> Tuple[List[str], SalesTotals]:
+    machine = Machine()
+    return vending_machine(instructions, machine), machine.totals
+
+def replay_chunk(chunk: List[List[List[str]]]) -> List[Tuple[List[str], SalesTotals]]:
+    return [replay_machine(instructions) for instructions in chunk]
+
+# Replays independent machines on a process pool. Streams go out in chunks
+# of chunksize machines with at most max_pending chunks in flight, so
+# finished output never piles up faster than the caller reads it. Output
+# comes back one machine at a time in input order, and each machine's
+# totals are folded into totals as it arrives.
+def vending_fleet(
+    streams: Iterable[List[List[str]]],
+    totals: SalesTotals,
+    processes: Optional[int] = None,
+    chunksize: int = 64,
+    max_pending: Optional[int] = None,
+) -> Iterator[List[str]]:
+    processes = processes or os.cpu_count() or 1
+    if max_pending is None:
+        max_pending = 2 * processes
+    streams = iter(streams)
+    pending: deque = deque()
+    with Pool(processes) as pool:
+        while True:
+            chunk = list(islice(streams, chunksize))
+            if chunk:
+                pending.append(pool.apply_async(replay_chunk, (chunk,)))
+            if not pending:
+                break
+            if chunk and len(pending) < max_pending:
+                continue
+            for output_lines, machine_totals in pending.popleft().get():
+                totals.add(machine_totals)
+                yield output_lines